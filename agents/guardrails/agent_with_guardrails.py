@@ -1,65 +1,273 @@
 import os
+import re
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import Optional
+from typing import Dict, Iterable, Iterator, Optional
+from pattern_matcher import PatternMatcher
+from batch_validation import evaluate_input, validate_texts
+from output_guard import OutputGuard, PII_PATTERNS
+from verdict_cache import VerdictCache, input_key
 
 load_dotenv()
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
+OUTPUT_LIMIT_POLICIES = ("truncate", "reject")
+SENTENCE_END = re.compile(r'[.!?](?=\s|$)')
+SENTENCE_BREAK = re.compile(r'[.!?]\s')  # a sentence end more text can't undo ("3." + "14")
+NO_TOPICS = PatternMatcher([])  # output guard matcher when topic checks are off
+
 class GuardrailAgent:
-    def __init__(self):
+    def __init__(self, output_limit_policy: str = "truncate"):
+        if output_limit_policy not in OUTPUT_LIMIT_POLICIES:
+            raise ValueError(f"output_limit_policy must be one of {OUTPUT_LIMIT_POLICIES}")
         self.model = genai.GenerativeModel('gemini-2.5-flash')
         self.blocked_topics = ['violence', 'harmful', 'illegal']
-        self.max_tokens = 1000
+        self.max_tokens = 1000  # enforced by the model via max_output_tokens
+        # On 2.5 models max_output_tokens also covers thinking tokens; set a budget
+        # (0 turns thinking off on Flash) so a long think can't use up the whole cap
+        self.thinking_budget: Optional[int] = None
+        self.max_input_length = 5000
+        # What to do with an answer cut off at max_tokens: "truncate" returns it up
+        # to its last complete sentence, "reject" returns an output guardrail alert
+        self.output_limit_policy = output_limit_policy
+        # Opt-in: reject answers that mention a blocked topic (benign answers often
+        # do, e.g. "smoking is harmful"), or contain emails, SSNs, card or phone numbers
+        self.check_output_topics = False
+        self.check_pii = False
+        self.token_usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0,
+                            "limit_reached": 0}
+        self.verdict_cache: Optional[VerdictCache] = VerdictCache()
+        self.cache_outputs = False
+
+    def enable_verdict_cache(self, max_entries: int = 10000, ttl_seconds: float = 300,
+                             cache_outputs: bool = False):
+        """Cache input verdicts by normalized input and rule-set version.
+
+        With cache_outputs, a validated answer is reused for repeats of the same
+        (normalized) input instead of calling generate_content again.
+        """
+        self.verdict_cache = VerdictCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.cache_outputs = cache_outputs
+
+    def disable_verdict_cache(self):
+        self.verdict_cache = None
+        self.cache_outputs = False
+
+    def policy_version(self) -> tuple:
+        """Everything a cached verdict or output depends on; changing any of it
+        (e.g. reloading blocked_topics) invalidates the cache"""
+        return (self._matcher.fingerprint, self.max_input_length, self.max_tokens,
+                self.thinking_budget, self.output_limit_policy, self.check_output_topics,
+                self.check_pii, getattr(self.model, "model_name", None))
+
+    def _cache_key(self, user_input: str) -> tuple:
+        return input_key(user_input, self.policy_version(),
+                         len(user_input) > self.max_input_length)
+
+    @property
+    def blocked_topics(self) -> tuple:
+        """Blocked terms and phrases; assigning a new list hot-reloads the matcher"""
+        return self._matcher.patterns
+
+    @blocked_topics.setter
+    def blocked_topics(self, topics: Iterable[str]):
+        # Build first, then swap the reference: requests already being validated
+        # finish with the old automaton and nothing waits on a lock
+        self._matcher = PatternMatcher(topics)
         
     def validate_input(self, user_input: str) -> tuple[bool, Optional[str]]:
         """Validate user input before processing"""
-        # Length check
-        if len(user_input) > 5000:
-            return False, "Input too long. Please keep it under 5000 characters."
-        
-        # Empty check
-        if not user_input.strip():
-            return False, "Input cannot be empty."
-        
-        # Blocked topics check
-        user_input_lower = user_input.lower()
-        for topic in self.blocked_topics:
-            if topic in user_input_lower:
-                return False, f"Sorry, I cannot discuss topics related to {topic}."
-        
-        return True, None
+        verdict, _, _ = self._input_verdict(user_input)
+        return verdict["valid"], verdict["reason"]
+
+    def _input_verdict(self, user_input: str) -> tuple[Dict, Optional[tuple], Optional[str]]:
+        """(verdict, cache key, cached output); key is None when the cache is off"""
+        if self.verdict_cache is None:
+            key = None
+        else:
+            key = self._cache_key(user_input)
+            entry = self.verdict_cache.get(key)
+            if entry is not None:
+                output = entry.get("output") if self.cache_outputs else None
+                return entry["verdict"], key, output
+        # Length, empty and blocked-topic checks (one Aho-Corasick pass, whole words only)
+        verdict = evaluate_input(user_input, self._matcher, self.max_input_length)
+        if key is not None:
+            self.verdict_cache.put(key, verdict)
+        return verdict, key, None
+
+    def _store_output(self, key: Optional[tuple], output: str):
+        if key is not None and self.cache_outputs:
+            self.verdict_cache.put_output(key, output)
+
+    def validate_batch(self, texts: Iterable[str], processes: int = None,
+                       chunk_size: int = 2000, min_parallel: int = 20000) -> Iterator[Dict]:
+        """Run the input rules over many texts without calling the model.
+
+        Yields {"valid", "reason", "matched_rules"} per text, in order; texts can be a
+        list or a stream. Beyond min_parallel texts the work is spread over a process
+        pool of `processes` workers (default: CPU count).
+        """
+        return validate_texts(texts, self._matcher, self.max_input_length,
+                              processes=processes, chunk_size=chunk_size,
+                              min_parallel=min_parallel)
     
+    def _output_guard(self) -> OutputGuard:
+        # No character budget: length is capped by max_output_tokens at generation
+        return OutputGuard(self._matcher if self.check_output_topics else NO_TOPICS,
+                           pii_patterns=PII_PATTERNS if self.check_pii else None)
+
+    def _generation_config(self) -> Dict:
+        config = {"max_output_tokens": self.max_tokens}
+        if self.thinking_budget is not None:
+            config["thinking_config"] = {"thinking_budget": self.thinking_budget}
+        return config
+
+    @staticmethod
+    def _response_text(response) -> str:
+        """Text of the first candidate, or "" when it has no text parts (response.text
+        raises then, e.g. when max_output_tokens ran out while the model was thinking)"""
+        candidates = getattr(response, "candidates", None) or []
+        content = getattr(candidates[0], "content", None) if candidates else None
+        return "".join(getattr(part, "text", "") or "" for part in getattr(content, "parts", None) or [])
+
+    def _record_usage(self, response) -> bool:
+        """Add the response's token counts to token_usage; True if it hit max_tokens"""
+        usage = getattr(response, "usage_metadata", None)
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self.token_usage["requests"] += 1
+        self.token_usage["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+        self.token_usage["output_tokens"] += output_tokens
+
+        candidates = getattr(response, "candidates", None) or []
+        reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        limit_reached = (getattr(reason, "name", reason) == "MAX_TOKENS"
+                         or output_tokens >= self.max_tokens)
+        if limit_reached:
+            self.token_usage["limit_reached"] += 1
+        return limit_reached
+
+    @staticmethod
+    def _truncate_to_sentence(text: str) -> str:
+        """Text up to its last sentence end; "" if no sentence is complete"""
+        ends = list(SENTENCE_END.finditer(text))
+        return text[:ends[-1].end()] if ends else ""
+
+    @staticmethod
+    def _split_at_sentence(text: str) -> tuple[str, str]:
+        """(complete sentences, unfinished rest) of streamed text"""
+        ends = list(SENTENCE_BREAK.finditer(text))
+        cut = ends[-1].start() + 1 if ends else 0
+        return text[:cut], text[cut:]
+
+    def _limit_alert(self) -> str:
+        return (f"⚠️ Output Guardrail: Response exceeded {self.max_tokens} tokens. "
+                "Please refine your question.")
+
     def validate_output(self, output: str) -> tuple[bool, Optional[str]]:
-        """Validate model output before returning"""
-        # Length check
-        if len(output) > self.max_tokens * 4:  # Rough character estimate
-            return False, "Response too long. Please refine your question."
-        
+        """Validate model output before returning (blocked topics if
+        check_output_topics, PII if check_pii)"""
+        guard = self._output_guard()
+        guard.feed(output)
+        guard.close()
+        if guard.violation:
+            return False, guard.violation[1]
         return True, None
     
     def process(self, user_input: str) -> str:
         """Process user input with guardrails"""
         # Input validation
-        is_valid, error_msg = self.validate_input(user_input)
-        if not is_valid:
-            return f"⚠️ Guardrail Alert: {error_msg}"
+        verdict, key, cached = self._input_verdict(user_input)
+        if not verdict["valid"]:
+            return f"⚠️ Guardrail Alert: {verdict['reason']}"
+        if cached is not None:
+            return cached
         
         try:
-            # Generate response
-            response = self.model.generate_content(user_input)
-            output = response.text
+            # Generate response, capped at max_tokens by the model itself
+            response = self.model.generate_content(
+                user_input, generation_config=self._generation_config())
+            # Usage and finish reason first: a reply cut off at max_tokens may have no text
+            limit_reached = self._record_usage(response)
+            output = self._response_text(response)
+            if limit_reached:
+                if self.output_limit_policy == "reject":
+                    return self._limit_alert()
+                output = self._truncate_to_sentence(output)
+                if not output.strip():
+                    return self._limit_alert()
+            elif not output:
+                output = response.text  # no text for another reason (e.g. blocked): raises why
             
             # Output validation
             is_valid, error_msg = self.validate_output(output)
             if not is_valid:
                 return f"⚠️ Output Guardrail: {error_msg}"
             
+            self._store_output(key, output)
             return output
             
         except Exception as e:
             return f"❌ Error: {str(e)}"
 
+    def process_stream(self, user_input: str) -> Iterator[str]:
+        """Like process(), but yields validated output while it is being generated.
+
+        Each streamed chunk goes through the output guardrails as it arrives; when a
+        rule fires, the stream is abandoned (no further chunks are read or paid
+        for) and an alert is yielded in place of the rest of the answer. Text already
+        yielded can't be taken back, so "truncate" only yields complete sentences and
+        drops an unfinished one when the answer hits max_tokens (yielding the alert if
+        nothing was complete), while "reject" appends the alert.
+        """
+        verdict, key, cached = self._input_verdict(user_input)
+        if not verdict["valid"]:
+            yield f"⚠️ Guardrail Alert: {verdict['reason']}"
+            return
+        if cached is not None:
+            yield cached
+            return
+
+        guard = self._output_guard()
+        released = []
+        unfinished = ""  # truncate: checked text held back until its sentence ends
+        try:
+            response = self.model.generate_content(
+                user_input, stream=True, generation_config=self._generation_config())
+            last_chunk = None
+            for chunk in response:
+                last_chunk = chunk
+                text = guard.feed(self._response_text(chunk))
+                if guard.violation:
+                    break
+                if self.output_limit_policy == "truncate":
+                    text, unfinished = self._split_at_sentence(unfinished + text)
+                if text:
+                    released.append(text)
+                    yield text
+            else:
+                text = unfinished + guard.close()
+                # Usage and finish reason arrive with the final chunk
+                limit_reached = last_chunk is not None and self._record_usage(last_chunk)
+                if limit_reached and self.output_limit_policy == "truncate":
+                    text = self._truncate_to_sentence(text)
+                elif not limit_reached and not released and not text and last_chunk is not None:
+                    last_chunk.text  # no text for another reason (e.g. blocked): raises why
+                if text:
+                    released.append(text)
+                    yield text
+                if limit_reached and (self.output_limit_policy == "reject"
+                                      or not "".join(released).strip()):
+                    yield self._limit_alert()
+                elif not guard.violation:
+                    self._store_output(key, "".join(released))
+
+            if guard.violation:
+                yield f"⚠️ Output Guardrail: {guard.violation[1]}"
+
+        except Exception as e:
+            yield f"❌ Error: {str(e)}"
+
 # Test
 if __name__ == "__main__":
     agent = GuardrailAgent()
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from pattern_matcher import PatternMatcher
+
+# Rules installed in each pool worker by _init_worker
+_worker_rules: Dict = {}
+
+
+def evaluate_input(text: str, matcher: PatternMatcher, max_length: int) -> Dict:
+    """Run every input rule on text.
+
+    Returns {"valid", "reason", "matched_rules"}; reason is the message for the first
+    rule that fired (length, then empty, then blocked topics).
+    """
+    matched: List[str] = []
+    reason: Optional[str] = None
+    if len(text) > max_length:
+        matched.append("max_length")
+        reason = f"Input too long. Please keep it under {max_length} characters."
+    if not text.strip():
+        matched.append("empty")
+        reason = reason or "Input cannot be empty."
+    topics = matcher.find_all(text)
+    if topics:
+        matched.extend(f"blocked_topic:{topic}" for topic in topics)
+        reason = reason or f"Sorry, I cannot discuss topics related to {topics[0]}."
+    return {"valid": not matched, "reason": reason, "matched_rules": matched}
+
+
+def _init_worker(matcher: PatternMatcher, max_length: int):
+    _worker_rules["matcher"] = matcher
+    _worker_rules["max_length"] = max_length
+
+
+def _evaluate_chunk(texts: List[str]) -> List[Dict]:
+    return [evaluate_input(text, _worker_rules["matcher"], _worker_rules["max_length"])
+            for text in texts]
+
+
+def validate_texts(texts: Iterable[str], matcher: PatternMatcher, max_length: int,
+                   processes: int = None, chunk_size: int = 2000,
+                   min_parallel: int = 20000) -> Iterator[Dict]:
+    """Yield a verdict per text, in input order.
+
+    The first min_parallel texts are checked in-process; if the input is longer, the
+    rest are sent in chunks to a process pool, with at most two chunks per worker in
+    flight so an unbounded stream is never read ahead far.
+    """
+    texts = iter(texts)
+    head = list(islice(texts, min_parallel))
+    for text in head:
+        yield evaluate_input(text, matcher, max_length)
+    if len(head) < min_parallel:
+        return
+
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processes,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(matcher, max_length)) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * processes:
+                chunk = list(islice(texts, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_evaluate_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
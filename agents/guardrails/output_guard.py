@@ -0,0 +1,103 @@
+import re
+from typing import Callable, Dict, Optional, Pattern, Tuple
+from pattern_matcher import PatternMatcher
+
+PII_PATTERNS: Dict[str, Pattern] = {
+    "email": re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]*\w"),
+    "ssn": re.compile(r"(?<![\d-])\d{3}-\d{2}-\d{4}(?![\d-])"),
+    # Visa/Mastercard/Discover 4-4-4-4 and Amex 4-6-5, one consistent separator
+    "credit_card": re.compile(r"(?<![\d-])(?:[2-6]\d{3}([ -]?)\d{4}\1\d{4}\1\d{4}"
+                              r"|3[47]\d{2}([ -]?)\d{6}\2\d{5})(?![\d-])"),
+    # Grouped numbers only ((555) 123-4567, 555-123-4567, +1 555 123 4567) or
+    # compact international +15551234567; bare digit runs are not phone numbers
+    "phone": re.compile(r"(?<![\w+])(?:(?:\+\d{1,3}[\s.-]?)?(?:\(\d{3}\)\s?|\d{3}[\s.-])"
+                        r"\d{3}[\s.-]\d{4}|\+\d{10,14})(?![\d-])")
+}
+PII_WINDOW = 64  # longest PII match looked for across chunk boundaries
+
+
+def luhn_valid(number: str) -> bool:
+    digits = [int(c) for c in number if c.isdigit()]
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2:
+            digit = digit * 2 - 9 if digit > 4 else digit * 2
+        total += digit
+    return total % 10 == 0
+
+
+# Extra checks a regex match must pass to count
+PII_VALIDATORS: Dict[str, Callable[[str], bool]] = {"credit_card": luhn_valid}
+
+
+def find_pii(text: str, patterns: Dict[str, Pattern] = None) -> Optional[str]:
+    """Name of the first PII rule matching text, or None"""
+    for name, pattern in (PII_PATTERNS if patterns is None else patterns).items():
+        validator = PII_VALIDATORS.get(name)
+        for match in pattern.finditer(text):
+            if validator is None or validator(match.group()):
+                return name
+    return None
+
+
+class OutputGuard:
+    """Validates model output incrementally: blocked topics, an optional character
+    budget (max_chars) and, when pii_patterns are given, PII.
+
+    feed() each piece as it arrives and release what it returns. The last
+    holdback characters are kept back until more text (or close()) shows they
+    don't start a blocked phrase or PII, so nothing that fails a rule is ever
+    released. Once a rule fires, violation holds (rule, message) and nothing more is
+    released.
+    """
+
+    def __init__(self, matcher: PatternMatcher, max_chars: int = None,
+                 pii_patterns: Dict[str, Pattern] = None):
+        self.max_chars = max_chars
+        self.pii_patterns = pii_patterns or {}
+        self.holdback = max(matcher.max_term_length, PII_WINDOW if self.pii_patterns else 0)
+        self.length = 0
+        self.violation: Optional[Tuple[str, str]] = None
+        self._scanner = matcher.scanner()
+        self._pending = ""
+
+    def _fail(self, rule: str, message: str) -> str:
+        self.violation = (rule, message)
+        self._pending = ""
+        return ""
+
+    def feed(self, chunk: str) -> str:
+        """Check the next piece of output; returns the text now safe to release"""
+        if self.violation:
+            return ""
+        self.length += len(chunk)
+        if self.max_chars is not None and self.length > self.max_chars:
+            return self._fail("max_length", "Response too long. Please refine your question.")
+
+        topics = self._scanner.feed(chunk)
+        if topics:
+            return self._fail(f"blocked_topic:{topics[0]}",
+                              f"Sorry, I cannot discuss topics related to {topics[0]}.")
+
+        self._pending += chunk
+        # Everything not yet released is re-checked, so PII split across chunks is caught
+        pii = find_pii(self._pending, self.pii_patterns) if self.pii_patterns else None
+        if pii is not None:
+            return self._fail(f"pii:{pii}", "Response contained personal information.")
+
+        cut = len(self._pending) - self.holdback
+        if cut <= 0:
+            return ""
+        released, self._pending = self._pending[:cut], self._pending[cut:]
+        return released
+
+    def close(self) -> str:
+        """End of output: final checks, then the held-back remainder"""
+        if self.violation:
+            return ""
+        topics = self._scanner.close()
+        if topics:
+            return self._fail(f"blocked_topic:{topics[0]}",
+                              f"Sorry, I cannot discuss topics related to {topics[0]}.")
+        released, self._pending = self._pending, ""
+        return released
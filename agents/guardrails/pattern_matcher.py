@@ -0,0 +1,157 @@
+import hashlib
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace runs, so phrases match across line breaks"""
+    return " ".join(text.lower().split())
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton over a set of case-insensitive terms and phrases.
+
+    One pass over the normalized text finds every occurrence of every pattern, so
+    the cost depends on the text length (plus matches), not on the pattern count.
+    With word_boundaries, a pattern only matches as whole words; a trailing "*"
+    (e.g. "harm*") lets it match as a word prefix instead.
+
+    Matchers are immutable once built: to change the pattern set, build a new one
+    and swap the reference, so scans already running keep using the old automaton.
+    """
+
+    def __init__(self, patterns: Iterable[str], word_boundaries: bool = True):
+        self.word_boundaries = word_boundaries
+        self.patterns: Tuple[str, ...] = tuple(dict.fromkeys(
+            p.strip() for p in patterns if p.strip() and p.strip() != "*"))
+        self._goto: List[dict] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self._terms: List[Tuple[str, bool]] = []  # (normalized term, prefix match)
+
+        for index, pattern in enumerate(self.patterns):
+            prefix = pattern.endswith("*")
+            term = normalize_text(pattern.rstrip("*"))
+            self._terms.append((term, prefix))
+            state = 0
+            for char in term:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].append(index)
+        self._build_failure_links()
+        self.max_term_length = max((len(term) for term, _ in self._terms), default=0)
+        self.fingerprint = hashlib.sha256(
+            "\0".join((str(word_boundaries),) + self.patterns).encode("utf-8")).hexdigest()[:16]
+
+    def _build_failure_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self._goto[state].items():
+                pending.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _bounded(self, text: str, start: int, end: int, term: str, prefix: bool) -> bool:
+        if not self.word_boundaries:
+            return True
+        if term[0].isalnum() and start > 0 and text[start - 1].isalnum():
+            return False
+        if (not prefix and term[-1].isalnum() and end < len(text)
+                and text[end].isalnum()):
+            return False
+        return True
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str]]:
+        """(offset in normalize_text(text), pattern) for each match, by match end"""
+        text = normalize_text(text)
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                term, prefix = self._terms[index]
+                start = position + 1 - len(term)
+                if self._bounded(text, start, position + 1, term, prefix):
+                    yield start, self.patterns[index]
+
+    def find_all(self, text: str) -> List[str]:
+        """Distinct patterns found in text, in order of first match"""
+        return list(dict.fromkeys(pattern for _, pattern in self.finditer(text)))
+
+    def search(self, text: str) -> Optional[str]:
+        """The first pattern found in text, or None"""
+        return next((pattern for _, pattern in self.finditer(text)), None)
+
+    def scanner(self) -> "StreamScanner":
+        return StreamScanner(self)
+
+
+class StreamScanner:
+    """Incremental matching over text that arrives in pieces (e.g. a model stream).
+
+    feed() returns patterns completed by the new text; a whole-word match at the end
+    of a piece is only reported once the next character (or close()) shows that
+    the word ends there.
+    """
+
+    def __init__(self, matcher: PatternMatcher):
+        self._matcher = matcher
+        self._state = 0
+        self._recent = deque(maxlen=matcher.max_term_length + 1)  # normalized chars seen
+        self._in_space = True  # collapse whitespace runs (and leading space) as normalize_text does
+        self._waiting: List[str] = []  # matches pending a right word boundary
+
+    def feed(self, text: str) -> List[str]:
+        found: List[str] = []
+        for char in text.lower():
+            if char.isspace():
+                if self._in_space:
+                    continue
+                self._in_space = True
+                char = " "
+            else:
+                self._in_space = False
+            self._step(char, found)
+        return found
+
+    def _step(self, char: str, found: List[str]):
+        if self._waiting:
+            if not char.isalnum():
+                found.extend(self._waiting)
+            self._waiting = []
+
+        matcher = self._matcher
+        state = self._state
+        while state and char not in matcher._goto[state]:
+            state = matcher._fail[state]
+        state = self._state = matcher._goto[state].get(char, 0)
+
+        for index in matcher._output[state]:
+            term, prefix = matcher._terms[index]
+            pattern = matcher.patterns[index]
+            if matcher.word_boundaries and term[0].isalnum() and len(self._recent) >= len(term):
+                if self._recent[-len(term)].isalnum():
+                    continue
+            if matcher.word_boundaries and not prefix and term[-1].isalnum():
+                self._waiting.append(pattern)
+            else:
+                found.append(pattern)
+        self._recent.append(char)
+
+    def close(self) -> List[str]:
+        """Patterns whose match ended at the very end of the text"""
+        found, self._waiting = self._waiting, []
+        return found
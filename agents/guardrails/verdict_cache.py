@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+from pattern_matcher import normalize_text
+
+
+def input_key(text: str, policy_version: Hashable, too_long: bool) -> tuple:
+    """Cache key: hash of the normalized input, the length verdict (normalizing
+    changes the length) and the rule-set version"""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return digest, too_long, policy_version
+
+
+class VerdictCache:
+    """Bounded LRU/TTL cache of guardrail verdicts (and optionally validated outputs).
+
+    Keys carry the rule-set version, so entries made under an older policy can never
+    be returned; the first lookup under a new version also drops them all.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _check_version(self, key: tuple):
+        if key[-1] != self._version:
+            self._entries.clear()
+            self._version = key[-1]
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """The entry for key ({"verdict", optionally "output"}), or None"""
+        with self._lock:
+            self._check_version(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["created"] > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, verdict: Dict):
+        with self._lock:
+            self._check_version(key)
+            self._entries[key] = {"verdict": verdict, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put_output(self, key: tuple, output: str):
+        """Attach a validated output to an existing verdict entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["output"] = output
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired
+        }
@@ -1,84 +1,862 @@
 import os
+import json
+import hashlib
+import asyncio
+import mmap
 from dotenv import load_dotenv
 from google import genai
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
 import numpy as np
-import re
+import queue
+import threading
+import time
+from vector_store import VectorStore, normalize, top_k_indices, save_npy, save_json
+from embedding_cache import EmbeddingCache, get_default_cache
+from ann_index import IVFIndex
+from sharded_search import ShardedSearch
+from chunking import (iter_text_chunks, iter_file_chunks, iter_buffer_chunk_spans, map_file,
+                      MappedFile, MappedFilePool)
+from rate_limiter import RateLimiter
+from keyword_index import InvertedIndex, reciprocal_rank_fusion, weighted_fusion
+from metadata_index import MetadataIndex
+from answer_cache import AnswerCache
+from context_packing import pack_context
+from dedup import MinHashDeduplicator
 
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-004"
+MAX_EMBED_BATCH = 100  # embed_content accepts at most 100 texts per request
+INDEX_FORMAT_VERSION = 2
+# HTTP statuses worth retrying as-is: timeout, rate limit, server-side errors
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+EMBED_RETRIES = 4
+
+
+def make_document_id(content: str, metadata: Dict = None) -> str:
+    """Stable id derived from the chunk text and all of its metadata"""
+    canonical = json.dumps(metadata or {}, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(f"{canonical}\0{content}".encode("utf-8")).hexdigest()[:16]
+
+
+def dedup_scope(metadata: Dict = None) -> str:
+    """Near-duplicates are only merged between documents whose metadata agrees
+    apart from their source(s), so e.g. one tenant's chunk never absorbs another's"""
+    scoped = {k: v for k, v in (metadata or {}).items() if k not in ("source", "sources")}
+    return json.dumps(scoped, sort_keys=True, default=str, separators=(",", ":")) if scoped else ""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for failures that say nothing about the input (rate limits, outages)"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "code", None) in TRANSIENT_STATUS_CODES
+
 
 class Document:
-    def __init__(self, content: str, metadata: Dict = None):
-        self.content = content
+    __slots__ = ("_content", "_span", "metadata", "id")
+
+    def __init__(self, content: str = None, metadata: Dict = None, span: Tuple = None,
+                 doc_id: str = None):
+        self._content = content
+        # (buffer, start, end) when the text lives in a mapped file; buffer is any
+        # object sliced to bytes (an mmap, or a MappedFile read through a pool)
+        self._span = span
         self.metadata = metadata or {}
-        self.id = id(self)
+        self.id = doc_id or make_document_id(content, self.metadata)
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            buffer, start, end = self._span
+            return bytes(buffer[start:end]).decode("utf-8")
+        return self._content
+
+    def preview(self, chars: int = 100) -> str:
+        """First chars characters, decoding no more of a mapped span than needed"""
+        if self._content is None:
+            buffer, start, end = self._span
+            end = min(end, start + 4 * chars)  # UTF-8 is at most 4 bytes per character
+            return bytes(buffer[start:end]).decode("utf-8", errors="ignore")[:chars]
+        return self._content[:chars]
 
 
 class AdvancedRAGAgent:
-    def __init__(self):
+    def __init__(self, embedding_cache: EmbeddingCache = None,
+                 requests_per_minute: float = None, storage_dtype: str = "float32",
+                 full_precision_path: str = None, rerank_factor: int = 4,
+                 compact_threshold: float = 0.3, max_open_files: int = 64):
         self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
         self.model_name = "gemini-2.5-flash"
+        self.embedding_cache = embedding_cache or get_default_cache()
+        self.rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
 
-        self.documents: List[Document] = []
-        self.document_embeddings: Dict[int, np.ndarray] = {}
+        # Row i of the vector store holds the embedding of documents[i];
+        # deleted rows hold None until compact() drops them
+        self.documents: List[Optional[Document]] = []
+        self._rows: Dict[str, int] = {}
+        self.metadata_index = MetadataIndex()
+        self.compact_threshold = compact_threshold
+        # float16/int8 storage cuts RAM 2-4x; with full_precision_path the top
+        # rerank_factor * top_k hits are re-scored against float32 copies on disk
+        self.full_precision_path = full_precision_path
+        self.vector_store = VectorStore(dtype=storage_dtype,
+                                        full_precision_path=full_precision_path)
+        self.rerank_factor = rerank_factor
+        # Source files of zero-copy documents, mapped on demand (LRU of max_open_files)
+        self.mapped_files = MappedFilePool(max_open_files)
+        self.ann_index: Optional[IVFIndex] = None
+        self.sharded_search: Optional[ShardedSearch] = None
+        self.keyword_index: Optional[InvertedIndex] = None
+        self.hybrid_config: Dict = {}
+        self.answer_cache: Optional[AnswerCache] = None
+        self.packing_config: Dict = {}
+        self.deduplicator: Optional[MinHashDeduplicator] = None
+        self.dedup_config: Dict = {}
+        self._pending_sources: Dict[str, List[str]] = {}  # merges for in-flight originals
 
     # ================= EMBEDDINGS =================
     def embed_text(self, text: str) -> np.ndarray:
+        cached = self.embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
         result = self.client.models.embed_content(
-            model="text-embedding-004",
+            model=EMBEDDING_MODEL,
             contents=text
         )
-        return np.array(result.embeddings[0].values)
+        return self.embedding_cache.put(EMBEDDING_MODEL, text, result.embeddings[0].values)
+
+    def embed_texts(self, texts: List[str],
+                    rate_limiter: RateLimiter = None) -> List[np.ndarray]:
+        """Embed several texts in a single embed_content request (cache misses only).
+
+        rate_limiter, when given, paces this call instead of the agent's own.
+        """
+        limiter = rate_limiter or self.rate_limiter
+
+        def embed_missing(missing: List[str]):
+            if limiter:
+                limiter.acquire()
+            result = self.client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=missing
+            )
+            return [e.values for e in result.embeddings]
+
+        return self.embedding_cache.get_or_embed(EMBEDDING_MODEL, texts, embed_missing)
+
+    def _embed_batch(self, batch: List[str], retries: int = EMBED_RETRIES,
+                     backoff: float = 1.0,
+                     rate_limiter: RateLimiter = None) -> List[Optional[np.ndarray]]:
+        """Embed a batch; texts that can't be embedded come back as None.
+
+        Transient errors (429, 5xx, timeouts) are retried with exponential backoff.
+        Only an invalid-input error (400) bisects the batch, so one bad chunk doesn't
+        sink the rest; anything else fails the whole batch at once.
+        """
+        for attempt in range(retries + 1):
+            try:
+                return self.embed_texts(batch, rate_limiter)
+            except Exception as e:
+                error = e
+                if attempt == retries or not is_transient_error(e):
+                    break
+                delay = backoff * 2 ** attempt
+                print(f"⏳ Embedding request failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+
+        if getattr(error, "code", None) == 400 and len(batch) > 1:
+            mid = len(batch) // 2
+            return (self._embed_batch(batch[:mid], retries, backoff, rate_limiter)
+                    + self._embed_batch(batch[mid:], retries, backoff, rate_limiter))
+        print(f"❌ Embedding failed for {len(batch)} text(s): {error}")
+        return [None] * len(batch)
 
     # ================= ADD DOCUMENT =================
-    def add_document(self, content: str, metadata: Dict = None):
-        doc = Document(content, metadata)
+    def _store(self, content: str, embedding: np.ndarray, metadata: Dict = None,
+               doc_id: str = None, span: Tuple = None):
+        if span is not None:
+            doc = Document(metadata=metadata, span=span,
+                           doc_id=doc_id or make_document_id(content, metadata))
+        else:
+            doc = Document(content, metadata, doc_id=doc_id)
+        if doc.id in self._rows:
+            self._delete_row(self._rows[doc.id])
         self.documents.append(doc)
-        self.document_embeddings[doc.id] = self.embed_text(content)
-        print(f"✓ Added document {len(self.documents)}")
+        rows = self.vector_store.add(embedding)
+        self._rows[doc.id] = rows[0]
+        self.metadata_index.add(rows[0], doc.metadata)
+        if self.ann_index is not None:
+            self.ann_index.add(rows, self.vector_store.vectors(rows))
+            self.ann_index.maybe_train(self.vector_store)
+        if self.keyword_index is not None:
+            self.keyword_index.add(rows[0], content)
+        if self.deduplicator is not None and doc.id not in self.deduplicator:
+            self.deduplicator.add(doc.id, content, dedup_scope(doc.metadata))
+        for source in self._pending_sources.pop(doc.id, []):
+            self._merge_source(doc.id, source)
+        return doc
+
+    def add_document(self, content: str, metadata: Dict = None, doc_id: str = None) -> str:
+        """Add one document; an existing document with the same id is replaced.
+
+        With deduplication enabled, a near-duplicate of an indexed document is not
+        embedded and the existing document's id is returned.
+        """
+        doc_id = doc_id or make_document_id(content, metadata)
+        duplicate = self._claim_duplicate(doc_id, content, metadata)
+        if duplicate is not None:
+            print(f"↺ Skipped near-duplicate of document {duplicate}")
+            return duplicate
+        try:
+            embedding = self.embed_text(content)
+        except Exception:
+            self._release_claim(doc_id)
+            raise
+        doc = self._store(content, embedding, metadata, doc_id)
+        print(f"✓ Added document {len(self._rows)}")
+        return doc.id
+
+    def add_documents(self, contents: Iterable[str], metadata: Dict = None,
+                      batch_size: int = MAX_EMBED_BATCH) -> Dict:
+        """Embed and add chunks in batched requests; returns ingestion stats.
 
-    def add_documents_from_text(self, text: str, chunk_size: int = 500):
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        chunk = ""
+        Chunks whose id (text + metadata) is already indexed, or that repeat an
+        earlier chunk of the same call, count as unchanged and are skipped without
+        an embedding call, so re-ingesting an unchanged file is cheap.
+        """
+        return self._add_chunks(((content, None) for content in contents), metadata, batch_size)
 
-        for sentence in sentences:
-            if len(chunk) + len(sentence) > chunk_size:
-                self.add_document(chunk.strip())
-                chunk = ""
-            chunk += sentence + " "
+    def _add_chunks(self, chunks: Iterable[Tuple[str, Optional[Tuple]]], metadata: Dict = None,
+                    batch_size: int = MAX_EMBED_BATCH) -> Dict:
+        """add_documents over (content, span) pairs; chunks with a span keep no text copy"""
+        batch_size = max(1, min(batch_size, MAX_EMBED_BATCH))
+        start = time.perf_counter()
+        added, unchanged, duplicates, failed = 0, 0, 0, []
+        batch: List[Tuple[str, Optional[Tuple]]] = []
+        metadata = dict(metadata or {})  # one dict shared by every chunk of the call
+        seen = set()  # ids of this call, so a repeated chunk is embedded once
 
-        if chunk.strip():
-            self.add_document(chunk.strip())
+        def flush():
+            nonlocal added
+            texts = [content for content, _ in batch]
+            for (content, span), embedding in zip(batch, self._embed_batch(texts)):
+                if embedding is None:
+                    self._release_claim(make_document_id(content, metadata))
+                    failed.append(content)
+                    continue
+                self._store(content, embedding, metadata, span=span)
+                added += 1
+            batch.clear()
+
+        for content, span in chunks:
+            doc_id = make_document_id(content, metadata)
+            if doc_id in self._rows or doc_id in seen:
+                unchanged += 1
+                continue
+            seen.add(doc_id)
+            if self._claim_duplicate(doc_id, content, metadata) is not None:
+                duplicates += 1
+                continue
+            batch.append((content, span))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        elapsed = time.perf_counter() - start
+        rate = added / elapsed if elapsed > 0 else 0.0
+        print(f"✓ Added {added} documents ({rate:.1f} chunks/sec, {len(failed)} failed)")
+        return {
+            "added": added,
+            "unchanged": unchanged,
+            "duplicates": duplicates,
+            "failed": len(failed),
+            "failed_chunks": failed,
+            "seconds": elapsed,
+            "chunks_per_sec": rate
+        }
 
-    def load_from_file(self, filepath: str):
-        with open(filepath, "r", encoding="utf-8") as f:
-            self.add_documents_from_text(f.read())
+    def add_documents_from_text(self, text: str, chunk_size: int = 500,
+                                metadata: Dict = None, overlap: int = 0) -> Dict:
+        return self.add_documents(iter_text_chunks(text, chunk_size, overlap), metadata)
+
+    def load_from_file(self, filepath: str, chunk_size: int = 500, overlap: int = 0,
+                       zero_copy: bool = False) -> Dict:
+        """Stream the file through the chunker into batched embedding.
+
+        With zero_copy, documents are (file, byte offset, end) ranges and text is only
+        read and decoded when used, through a bounded pool of file maps (the file
+        must not change while indexed).
+        """
+        stats = self._add_chunks(self._iter_file_chunks(filepath, chunk_size, overlap, zero_copy),
+                                 metadata={"source": filepath})
         print(f"✓ Loaded file {filepath}")
+        return stats
+
+    def _iter_file_chunks(self, filepath: str, chunk_size: int, overlap: int,
+                          zero_copy: bool) -> Iterator[Tuple[str, Optional[Tuple]]]:
+        if not zero_copy:
+            for chunk in iter_file_chunks(filepath, chunk_size, overlap):
+                yield chunk, None
+            return
+        # This map is only used for chunking; documents read through the pool later
+        source = MappedFile(filepath, self.mapped_files)
+        buffer = map_file(filepath)
+        spans = iter_buffer_chunk_spans(buffer, chunk_size, overlap)
+        try:
+            for start, end in spans:
+                yield bytes(buffer[start:end]).decode("utf-8"), (source, start, end)
+        finally:
+            spans.close()  # drops the regex scanner's view, so the map can close
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+    # ================= UPDATE / DELETE =================
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        row = self._rows.get(doc_id)
+        return None if row is None else self.documents[row]
+
+    def update_document(self, doc_id: str, content: str, metadata: Dict = None) -> bool:
+        """Re-embed and replace a document, keeping its id"""
+        old = self.get_document(doc_id)
+        if old is None:
+            return False
+        metadata = old.metadata if metadata is None else metadata
+        self._store(content, self.embed_text(content), metadata, doc_id)
+        self._maybe_compact()
+        return True
+
+    def delete_document(self, doc_id: str) -> bool:
+        row = self._rows.get(doc_id)
+        if row is None:
+            return False
+        self._delete_row(row)
+        self._maybe_compact()
+        return True
+
+    def _delete_row(self, row: int):
+        """Tombstone a row in the store and every index built on it"""
+        doc = self.documents[row]
+        self._rows.pop(doc.id, None)
+        self.documents[row] = None
+        self.metadata_index.remove(row, doc.metadata)
+        self.vector_store.delete(row)
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_document(doc.id)
+        if self.keyword_index is not None:
+            self.keyword_index.remove(row)
+        if self.deduplicator is not None:
+            self.deduplicator.remove(doc.id)
+
+    def _maybe_compact(self):
+        store = self.vector_store
+        if store.deleted_count and store.deleted_count >= self.compact_threshold * len(store):
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows from the store and renumber the indexes over it.
+
+        ANN lists and keyword postings are remapped in place (no k-means retrain or
+        re-tokenizing); the deduplicator is keyed by document id and left alone.
+        """
+        size = len(self.documents)
+        keep = self.vector_store.compact()
+        if len(keep) == size:
+            return
+        self.documents = [self.documents[i] for i in keep]
+        self._rows = {doc.id: row for row, doc in enumerate(self.documents)}
+        self.metadata_index = MetadataIndex()
+        for row, doc in enumerate(self.documents):
+            self.metadata_index.add(row, doc.metadata)
+        if self.ann_index is not None:
+            self.ann_index.remap(keep, size)
+        if self.keyword_index is not None:
+            self.keyword_index.remap(keep, size)
+        print(f"✓ Compacted index to {len(self.documents)} documents")
+
+    def _rebuild_indexes(self):
+        self.metadata_index = MetadataIndex()
+        for row, doc in enumerate(self.documents):
+            if doc is not None:
+                self.metadata_index.add(row, doc.metadata)
+        if self.ann_index is not None:
+            self.enable_ann_index(self.ann_index.n_lists, self.ann_index.nprobe,
+                                  self.ann_index.min_train_size)
+        if self.keyword_index is not None:
+            self.enable_hybrid_retrieval(**self.hybrid_config)
+        if self.deduplicator is not None:
+            self.enable_deduplication(**self.dedup_config)
+
+    # ================= DIRECTORY INGESTION =================
+    @staticmethod
+    def _find_files(directory: str, patterns: Iterable[str], recursive: bool) -> List[Path]:
+        root = Path(directory)
+        found = set()
+        for pattern in patterns:
+            matches = root.rglob(pattern) if recursive else root.glob(pattern)
+            found.update(p for p in matches if p.is_file())
+        return sorted(found)
+
+    def ingest_directory(self, directory: str, patterns: Iterable[str] = ("*.txt", "*.md"),
+                         recursive: bool = True, chunk_size: int = 500, overlap: int = 0,
+                         max_workers: int = 8, requests_per_minute: float = None,
+                         batch_size: int = MAX_EMBED_BATCH,
+                         on_progress: Callable[[Dict], None] = None,
+                         report_every: int = 10, zero_copy: bool = False) -> Dict:
+        """Chunk matching files in parallel and embed them through a bounded worker pool.
+
+        Chunking threads feed a bounded queue of batches, embedding workers drain it
+        (paced by requests_per_minute for this call when given, else by the agent's
+        own limit) and this thread stores results, so memory stays bounded however
+        many files match. zero_copy works as in load_from_file.
+        """
+        rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+        batch_size = max(1, min(batch_size, MAX_EMBED_BATCH))
+        files = self._find_files(directory, patterns, recursive)
+        work: "queue.Queue" = queue.Queue(maxsize=max_workers * 2)
+        results: "queue.Queue" = queue.Queue()
+        stats = {"files": len(files), "file_errors": 0, "batches": 0,
+                 "added": 0, "duplicates": 0, "failed": 0, "seconds": 0.0, "chunks_per_sec": 0.0}
+        start = time.perf_counter()
+
+        def chunk_file(path: Path):
+            batch = []
+            source = {"source": str(path)}
+            seen = set()
+            try:
+                for chunk, span in self._iter_file_chunks(str(path), chunk_size, overlap,
+                                                          zero_copy):
+                    doc_id = make_document_id(chunk, source)
+                    if doc_id in self._rows or doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    if self.deduplicator is not None:
+                        duplicate = self.deduplicator.claim(doc_id, chunk, dedup_scope(source))
+                        if duplicate is not None:
+                            # Merged on this thread's behalf by the storing loop
+                            results.put(("duplicate", path, duplicate))
+                            continue
+                    batch.append((chunk, span))
+                    if len(batch) >= batch_size:
+                        work.put((path, batch))
+                        batch = []
+                if batch:
+                    work.put((path, batch))
+            except Exception as e:
+                # Any failure is reported, never lost in an unread future; chunks
+                # claimed for the unsent batch are released for other files
+                for chunk, _ in batch:
+                    self._release_claim(make_document_id(chunk, source))
+                results.put(("error", path, e))
+
+        def embed_worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    results.put(("done", None, None))
+                    return
+                path, batch = item
+                texts = [chunk for chunk, _ in batch]
+                results.put(("batch", path, (batch, self._embed_batch(
+                    texts, rate_limiter=rate_limiter))))
+
+        def report():
+            elapsed = time.perf_counter() - start
+            stats["seconds"] = elapsed
+            stats["chunks_per_sec"] = stats["added"] / elapsed if elapsed > 0 else 0.0
+            if on_progress:
+                on_progress(dict(stats))
+            else:
+                print(f"📥 {stats['added']} chunks from {stats['files']} files "
+                      f"({stats['chunks_per_sec']:.1f} chunks/sec, {stats['failed']} failed)")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as chunkers, \
+                ThreadPoolExecutor(max_workers=max_workers) as embedders:
+            for _ in range(max_workers):
+                embedders.submit(embed_worker)
+            chunk_futures = [chunkers.submit(chunk_file, path) for path in files]
+
+            def close_work_queue():
+                wait(chunk_futures)
+                for _ in range(max_workers):
+                    work.put(None)
+            threading.Thread(target=close_work_queue, daemon=True).start()
+
+            finished_workers = 0
+            while finished_workers < max_workers:
+                kind, path, payload = results.get()
+                if kind == "done":
+                    finished_workers += 1
+                elif kind == "error":
+                    stats["file_errors"] += 1
+                    print(f"❌ Could not ingest {path}: {payload}")
+                elif kind == "duplicate":
+                    stats["duplicates"] += 1
+                    if self.dedup_config["merge"]:
+                        self._merge_source(payload, str(path))
+                else:
+                    batch, embeddings = payload
+                    source = {"source": str(path)}
+                    for (content, span), embedding in zip(batch, embeddings):
+                        if embedding is None:
+                            self._release_claim(make_document_id(content, source))
+                            stats["failed"] += 1
+                            continue
+                        self._store(content, embedding, source, span=span)
+                        stats["added"] += 1
+                    stats["batches"] += 1
+                    if stats["batches"] % report_every == 0:
+                        report()
+
+        report()
+        print(f"✓ Ingested {directory}")
+        return stats
+
+    # ================= NEAR-DUPLICATE DETECTION =================
+    def enable_deduplication(self, threshold: float = 0.85, merge: bool = True,
+                             num_perm: int = 128, bands: int = 32, shingle_size: int = 5):
+        """Skip chunks whose estimated shingle Jaccard similarity to an indexed
+        document is at least threshold (MinHash/LSH), before they are embedded.
+
+        Only documents with the same metadata apart from source are compared, so
+        the kept document matches every filter the duplicate would have. With
+        merge, the duplicate's source is appended to the kept document's "sources"
+        metadata, so filters on sources still find it.
+        """
+        self.dedup_config = {"threshold": threshold, "merge": merge, "num_perm": num_perm,
+                             "bands": bands, "shingle_size": shingle_size}
+        self.deduplicator = MinHashDeduplicator(threshold=threshold, num_perm=num_perm,
+                                                bands=bands, shingle_size=shingle_size)
+        for doc in self.documents:
+            if doc is not None:
+                self.deduplicator.add(doc.id, doc.content, dedup_scope(doc.metadata))
+
+    def disable_deduplication(self):
+        self.deduplicator = None
+        self.dedup_config = {}
+        self._pending_sources.clear()
+
+    def _claim_duplicate(self, doc_id: str, content: str, metadata: Dict = None) -> Optional[str]:
+        """Id of an indexed (or in-flight) near-duplicate, merging the source into it"""
+        if self.deduplicator is None or doc_id in self._rows:
+            return None
+        duplicate = self.deduplicator.claim(doc_id, content, dedup_scope(metadata))
+        if duplicate is not None and self.dedup_config["merge"]:
+            source = (metadata or {}).get("source")
+            if source:
+                self._merge_source(duplicate, source)
+        return duplicate
+
+    def _release_claim(self, doc_id: str):
+        """Forget a claimed chunk whose embedding failed"""
+        if self.deduplicator is not None and doc_id not in self._rows:
+            self.deduplicator.remove(doc_id)
+            self._pending_sources.pop(doc_id, None)
+
+    def _merge_source(self, doc_id: str, source: str):
+        row = self._rows.get(doc_id)
+        if row is None:
+            self._pending_sources.setdefault(doc_id, []).append(source)
+            return
+        doc = self.documents[row]
+        sources = list(doc.metadata.get("sources") or
+                       ([doc.metadata["source"]] if "source" in doc.metadata else []))
+        if source in sources:
+            return
+        self.metadata_index.remove(row, doc.metadata)
+        doc.metadata = dict(doc.metadata, sources=sources + [source])
+        self.metadata_index.add(row, doc.metadata)
+
+    # ================= ANN INDEX =================
+    def enable_ann_index(self, n_lists: int = None, nprobe: int = 8,
+                         min_train_size: int = 10000):
+        """Switch retrieval to an IVF index; exact search is used until it is trained.
+
+        nprobe trades recall for latency; n_lists defaults to 4*sqrt(N) at training time.
+        """
+        self.ann_index = IVFIndex(n_lists=n_lists, nprobe=nprobe, min_train_size=min_train_size)
+        self.ann_index.maybe_train(self.vector_store)
+
+    def disable_ann_index(self):
+        self.ann_index = None
+
+    # ================= SHARDED SEARCH =================
+    def enable_sharded_search(self, n_workers: int = None, min_rows: int = 50000):
+        """Score exact dense searches in parallel worker processes over shared memory.
+
+        Worth it once the store is too large for one core's memory bandwidth;
+        n_workers defaults to the CPU count. The matrix is copied into shared
+        memory (twice the RAM), except for an index opened with open_index, whose
+        saved embeddings the workers map from disk.
+        """
+        self.disable_sharded_search()
+        self.sharded_search = ShardedSearch(n_workers=n_workers, min_rows=min_rows)
+
+    def disable_sharded_search(self):
+        if self.sharded_search is not None:
+            self.sharded_search.close()
+        self.sharded_search = None
+
+    # ================= HYBRID RETRIEVAL =================
+    def enable_hybrid_retrieval(self, fusion: str = "rrf", dense_weight: float = 0.5,
+                                candidate_pool: int = 100, prefilter: bool = False):
+        """Fuse BM25 keyword scores with dense scores at retrieval time.
+
+        fusion is "rrf" (reciprocal rank) or "weighted" (min-max blend using
+        dense_weight). With prefilter=True only the BM25 shortlist of candidate_pool
+        documents is scored densely.
+        """
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        self.hybrid_config = {
+            "fusion": fusion,
+            "dense_weight": dense_weight,
+            "candidate_pool": candidate_pool,
+            "prefilter": prefilter
+        }
+        self.keyword_index = InvertedIndex()
+        for row, doc in enumerate(self.documents):
+            if doc is not None:
+                self.keyword_index.add(row, doc.content)
+
+    def disable_hybrid_retrieval(self):
+        self.keyword_index = None
+        self.hybrid_config = {}
+
+    def _hybrid_search(self, query: str, query_embedding: np.ndarray, top_k: int,
+                       rows: np.ndarray = None) -> List[Tuple[int, float]]:
+        config = self.hybrid_config
+        pool = max(config["candidate_pool"], top_k)
+        sparse = self.keyword_index.search(query, pool, allowed=rows)
+
+        if config["prefilter"] and sparse:
+            shortlist = np.array([row for row, _ in sparse])
+            dense = self._rerank(query_embedding, self._score_rows(query_embedding, shortlist, pool),
+                                 pool)
+        else:
+            dense = self._dense_search(query_embedding, pool, rows)
+
+        if config["fusion"] == "weighted":
+            fused = weighted_fusion(dense, sparse, config["dense_weight"])
+        else:
+            fused = reciprocal_rank_fusion([dense, sparse])
+        return fused[:top_k]
 
     # ================= SIMILARITY =================
     def cosine_similarity(self, a, b):
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-    def retrieve_relevant_documents(self, query: str, top_k: int = 3):
-        query_embedding = self.embed_text(query)
-        scores = []
+    def retrieve_relevant_documents(self, query: str, top_k: int = 3, filters: Dict = None):
+        """Top-k documents for the query, optionally restricted by metadata filters.
 
-        for doc in self.documents:
-            sim = self.cosine_similarity(query_embedding, self.document_embeddings[doc.id])
-            scores.append((doc, float(sim)))
+        filters, e.g. {"tenant": "acme", "tags": ["faq", "billing"],
+        "date": {"gte": "2024-01-01"}}, are resolved through the metadata index so
+        only matching rows are scored.
+        """
+        if not self._rows:
+            return []
+        rows = self._filter_rows(filters)
+        if rows is not None and len(rows) == 0:
+            return []
+        return self._retrieve(query, self.embed_text(query), top_k, rows)
+
+    def _filter_rows(self, filters: Dict) -> Optional[np.ndarray]:
+        return self.metadata_index.filter(filters) if filters else None
+
+    def _retrieve(self, query: str, query_embedding: np.ndarray, top_k: int,
+                  rows: np.ndarray = None) -> List[Tuple[Document, float]]:
+        if self.keyword_index is not None:
+            hits = self._hybrid_search(query, query_embedding, top_k, rows)
+        else:
+            hits = self._dense_search(query_embedding, top_k, rows)
+        return [(self.documents[row], score) for row, score in hits]
+
+    def _score_rows(self, query_embedding: np.ndarray, rows: np.ndarray,
+                    top_k: int) -> List[Tuple[int, float]]:
+        """Exact top-k over a subset of rows"""
+        store = self.vector_store
+        scores = store.mask_deleted(store.score(normalize(query_embedding), rows), rows)
+        return [(int(rows[i]), float(scores[i]))
+                for i in top_k_indices(scores, top_k) if np.isfinite(scores[i])]
+
+    def _rerank_pool(self, top_k: int) -> int:
+        if self.vector_store.quantized and self.vector_store.full_precision_path:
+            return top_k * max(self.rerank_factor, 1)
+        return top_k
 
-        scores.sort(key=lambda x: x[1], reverse=True)
-        return scores[:top_k]
+    def _dense_search(self, query_embedding: np.ndarray, top_k: int,
+                      rows: np.ndarray = None) -> List[Tuple[int, float]]:
+        pool = self._rerank_pool(top_k)
+        if rows is not None:
+            hits = self._score_rows(query_embedding, rows, pool)
+        elif self.ann_index is not None:
+            hits = self.ann_index.search(query_embedding, self.vector_store, pool)
+        elif self.sharded_search is not None:
+            hits = self.sharded_search.search(self.vector_store, query_embedding, pool)
+        else:
+            hits = self.vector_store.search(query_embedding, pool)
+        return self._rerank(query_embedding, hits, top_k)
+
+    def _rerank(self, query_embedding: np.ndarray, hits: List[Tuple[int, float]],
+                top_k: int) -> List[Tuple[int, float]]:
+        if self.vector_store.quantized and self.rerank_factor:
+            return self.vector_store.rerank(query_embedding, hits, top_k)
+        return hits[:top_k]
+
+    # ================= ANSWER CACHE =================
+    def enable_answer_cache(self, similarity_threshold: float = 0.95,
+                            max_entries: int = 1000, ttl_seconds: float = 3600):
+        """Reuse answers for near-duplicate questions over unchanged documents"""
+        self.answer_cache = AnswerCache(similarity_threshold, max_entries, ttl_seconds)
+
+    def disable_answer_cache(self):
+        self.answer_cache = None
+
+    # ================= CONTEXT PACKING =================
+    def enable_context_packing(self, token_budget: int = 1500, diversity: float = 0.3,
+                               candidate_factor: int = 3):
+        """Pack prompts from top_k * candidate_factor candidates within token_budget.
+
+        Candidates are ordered by MMR (diversity 0 = pure relevance), sentences repeated
+        across chunks are dropped and selection stops when the budget is full.
+        """
+        self.packing_config = {
+            "token_budget": token_budget,
+            "diversity": diversity,
+            "candidate_factor": max(1, candidate_factor)
+        }
+
+    def disable_context_packing(self):
+        self.packing_config = {}
+
+    def _pack(self, relevant_docs: List[Tuple[Document, float]]) -> List[Tuple[Document, str]]:
+        if not relevant_docs:
+            return []
+        config = self.packing_config
+        rows = [self._rows[doc.id] for doc, _ in relevant_docs]
+        packed = pack_context(
+            [doc.content for doc, _ in relevant_docs],
+            [score for _, score in relevant_docs],
+            self.vector_store.vectors(np.array(rows)),
+            config["token_budget"],
+            config["diversity"]
+        )
+        return [(relevant_docs[i][0], text) for i, text in packed]
 
     # ================= GENERATION =================
-    def answer_question(self, question: str, top_k: int = 3):
-        relevant_docs = self.retrieve_relevant_documents(question, top_k)
+    def answer_question(self, question: str, top_k: int = 3, filters: Dict = None):
+        cache_key = (top_k, json.dumps(filters, sort_keys=True, default=str))
+        query_embedding = None
+        if self.answer_cache is not None:
+            # The embedding cache makes the retrieval below reuse this embedding
+            query_embedding = self.embed_text(question)
+            cached = self._cached_answer(query_embedding, cache_key)
+            if cached is not None:
+                return cached
+
+        retrieved = self.retrieve_relevant_documents(question, self._candidate_count(top_k), filters)
+        return self._answer_from_documents(question, retrieved, query_embedding, cache_key)
+
+    def answer_questions(self, questions: List[str], top_k: int = 3, filters: Dict = None,
+                         max_concurrency: int = 8) -> List[Dict]:
+        """Answer a batch of questions; results come back in input order.
+
+        Queries are embedded in batched requests and, for plain dense retrieval,
+        scored with one matrix-matrix product. Generation calls run concurrently on
+        at most max_concurrency threads. Each result is {"question", "answer",
+        "sources", "error"}; a failed item gets an error message instead of failing
+        the batch, and None otherwise.
+        """
+        results: List[Optional[Dict]] = [None] * len(questions)
+        cache_key = (top_k, json.dumps(filters, sort_keys=True, default=str))
+
+        embeddings: List[Optional[np.ndarray]] = []
+        for start in range(0, len(questions), MAX_EMBED_BATCH):
+            embeddings.extend(self._embed_batch(questions[start:start + MAX_EMBED_BATCH]))
+
+        pending = []
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                results[i] = {"answer": None, "sources": [], "error": "Embedding failed"}
+                continue
+            if self.answer_cache is not None:
+                cached = self._cached_answer(embedding, cache_key)
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.append(i)
+
+        retrieved = {i: [] for i in pending}
+        rows = self._filter_rows(filters)
+        candidates = self._candidate_count(top_k)
+        if pending and self._rows and (rows is None or len(rows) > 0):
+            if rows is None and self.keyword_index is None and self.ann_index is None:
+                queries = np.stack([embeddings[i] for i in pending])
+                pool = self._rerank_pool(candidates)
+                if self.sharded_search is not None:
+                    batch_hits = self.sharded_search.search_many(self.vector_store, queries, pool)
+                else:
+                    batch_hits = self.vector_store.search_many(queries, pool)
+                for i, hits in zip(pending, batch_hits):
+                    hits = self._rerank(embeddings[i], hits, candidates)
+                    retrieved[i] = [(self.documents[row], score) for row, score in hits]
+            else:
+                for i in pending:
+                    retrieved[i] = self._retrieve(questions[i], embeddings[i], candidates, rows)
 
+        def answer(i: int) -> Dict:
+            try:
+                return self._answer_from_documents(questions[i], retrieved[i],
+                                                   embeddings[i], cache_key)
+            except Exception as e:
+                return {"answer": None, "sources": [], "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            for i, result in zip(pending, pool.map(answer, pending)):
+                results[i] = result
+        # Cached results are shared, so each item gets its own dict
+        return [{"question": question, "answer": result["answer"],
+                 "sources": result["sources"], "error": result.get("error")}
+                for question, result in zip(questions, results)]
+
+    def _candidate_count(self, top_k: int) -> int:
+        if self.packing_config:
+            return top_k * self.packing_config["candidate_factor"]
+        return top_k
+
+    def _cached_answer(self, query_embedding: np.ndarray, cache_key) -> Optional[Dict]:
+        return self.answer_cache.lookup(
+            query_embedding, cache_key,
+            is_valid=lambda doc_ids: all(i in self._rows for i in doc_ids)
+        )
+
+    def _answer_from_documents(self, question: str, retrieved: List[Tuple[Document, float]],
+                               query_embedding: Optional[np.ndarray], cache_key) -> Dict:
+        relevant_docs, prompt = self._build_prompt(question, retrieved)
         if not relevant_docs:
             return {"answer": "No information found.", "sources": []}
 
-        context = "\n\n".join([doc.content for doc, _ in relevant_docs])
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=prompt
+        )
+        return self._finish_answer(relevant_docs, response.text, query_embedding, cache_key)
+
+    def _build_prompt(self, question: str, retrieved: List[Tuple[Document, float]]):
+        if self.packing_config:
+            relevant_docs = self._pack(retrieved)
+        else:
+            relevant_docs = [(doc, doc.content) for doc, _ in retrieved]
+
+        if not relevant_docs:
+            return [], None
+
+        context = "\n\n".join([text for _, text in relevant_docs])
 
         prompt = f"""
 Answer the question using ONLY the context below.
@@ -90,22 +868,154 @@ Context:
 Question: {question}
 Answer:
 """
+        return relevant_docs, prompt
 
-        response = self.client.models.generate_content(
+    def _finish_answer(self, relevant_docs: List[Tuple[Document, str]], answer: str,
+                       query_embedding: Optional[np.ndarray], cache_key) -> Dict:
+        result = {
+            "answer": answer,
+            "sources": [doc.preview(100) for doc, _ in relevant_docs]
+        }
+        if self.answer_cache is not None and query_embedding is not None:
+            self.answer_cache.put(query_embedding, cache_key,
+                                  [doc.id for doc, _ in relevant_docs], result)
+        return result
+
+    # ================= ASYNC API =================
+    # Network calls go through the SDK's async client; CPU-bound retrieval and
+    # blocking rate-limit waits run in the default executor, off the event loop.
+    async def aembed_text(self, text: str) -> np.ndarray:
+        cached = self.embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
+        if self.rate_limiter:
+            await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.acquire)
+        result = await self.client.aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=text
+        )
+        return self.embedding_cache.put(EMBEDDING_MODEL, text, result.embeddings[0].values)
+
+    async def aretrieve_relevant_documents(self, query: str, top_k: int = 3,
+                                           filters: Dict = None):
+        if not self._rows:
+            return []
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, self._filter_rows, filters)
+        if rows is not None and len(rows) == 0:
+            return []
+        query_embedding = await self.aembed_text(query)
+        return await loop.run_in_executor(None, self._retrieve, query, query_embedding,
+                                          top_k, rows)
+
+    async def aanswer_question(self, question: str, top_k: int = 3, filters: Dict = None):
+        cache_key = (top_k, json.dumps(filters, sort_keys=True, default=str))
+        query_embedding = None
+        if self.answer_cache is not None:
+            query_embedding = await self.aembed_text(question)
+            cached = self._cached_answer(query_embedding, cache_key)
+            if cached is not None:
+                return cached
+
+        retrieved = await self.aretrieve_relevant_documents(
+            question, self._candidate_count(top_k), filters)
+        relevant_docs, prompt = await asyncio.get_running_loop().run_in_executor(
+            None, self._build_prompt, question, retrieved)
+        if not relevant_docs:
+            return {"answer": "No information found.", "sources": []}
+
+        response = await self.client.aio.models.generate_content(
             model=self.model_name,
             contents=prompt
         )
+        return self._finish_answer(relevant_docs, response.text, query_embedding, cache_key)
 
-        return {
-            "answer": response.text,
-            "sources": [doc.content[:100] for doc, _ in relevant_docs]
-        }
+    # ================= PERSISTENCE =================
+    def save_index(self, directory: str):
+        """Persist embeddings (mmap-able .npy) plus a compact text/metadata sidecar.
+
+        Tombstoned rows are compacted away first. Every file is replaced atomically
+        and index.json last, so saving over the index this agent was opened from is
+        safe; open_index rejects a directory caught mid-save (mismatched counts).
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.compact()
+        self.vector_store.save(directory)
+
+        contents_path = os.path.join(directory, "contents.bin")
+        offsets = np.zeros(len(self.documents) + 1, dtype=np.int64)
+        with open(contents_path + ".tmp", "wb") as f:
+            for i, doc in enumerate(self.documents):
+                data = doc.content.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        os.replace(contents_path + ".tmp", contents_path)
+        save_npy(os.path.join(directory, "offsets.npy"), offsets)
+
+        save_json(os.path.join(directory, "metadata.json"),
+                  [{"id": doc.id, "metadata": doc.metadata} for doc in self.documents],
+                  separators=(",", ":"))
+
+        save_json(os.path.join(directory, "index.json"), {
+            "version": INDEX_FORMAT_VERSION,
+            "embedding_model": EMBEDDING_MODEL,
+            "documents": len(self.documents),
+            "dim": self.vector_store.dim,
+            "storage_dtype": self.vector_store.dtype
+        }, indent=2)
+        print(f"✓ Saved index ({len(self.documents)} documents) to {directory}")
+
+    def open_index(self, directory: str):
+        """Replace the in-memory index with a saved one, without re-embedding.
+
+        Embeddings and document text stay memory-mapped; text is decoded on access.
+        """
+        with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version: {manifest.get('version')}")
+        if manifest.get("embedding_model") != EMBEDDING_MODEL:
+            raise ValueError(f"Index was built with {manifest.get('embedding_model')}, "
+                             f"agent uses {EMBEDDING_MODEL}")
+
+        store = VectorStore.open(directory, full_precision_path=self.full_precision_path)
+        offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "metadata.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+        counts = (manifest.get("documents"), len(entries), store.size, len(offsets) - 1)
+        if len(set(counts)) > 1:
+            raise ValueError(f"Index files in {directory} disagree on the document count "
+                             f"(manifest, metadata, embeddings, contents: {counts}); "
+                             "was it opened during a save?")
+
+        with open(os.path.join(directory, "contents.bin"), "rb") as f:
+            if offsets[-1] > 0:
+                contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                contents = b""
+
+        self.vector_store = store
+        self.documents = [
+            Document(metadata=entry["metadata"], doc_id=entry["id"],
+                     span=(contents, int(offsets[i]), int(offsets[i + 1])))
+            for i, entry in enumerate(entries)
+        ]
+        self._rows = {doc.id: row for row, doc in enumerate(self.documents)}
+        self._rebuild_indexes()
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+        print(f"✓ Opened index ({len(self.documents)} documents) from {directory}")
 
     # ================= STATS =================
     def get_stats(self):
         return {
-            "documents": len(self.documents),
-            "embeddings": len(self.document_embeddings)
+            "documents": len(self._rows),
+            "deleted": self.vector_store.deleted_count,
+            "embeddings": len(self.vector_store),
+            "storage_dtype": self.vector_store.dtype,
+            "embedding_bytes": self.vector_store.nbytes,
+            "embedding_cache": self.embedding_cache.get_stats(),
+            "answer_cache": self.answer_cache.get_stats() if self.answer_cache else None
         }
 
 
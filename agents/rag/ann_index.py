@@ -0,0 +1,143 @@
+from typing import List, Tuple, Optional
+import time
+import numpy as np
+from vector_store import VectorStore, normalize, top_k_indices
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10,
+                     seed: int = 0) -> np.ndarray:
+    """k-means on unit vectors using dot-product assignment; returns unit centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize(sums)
+
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the normalised rows of a VectorStore.
+
+    Rows are bucketed by their nearest k-means centroid; a query only scores the rows
+    in its nprobe closest buckets. Until min_train_size rows exist the index stays
+    untrained and search() falls back to exact scoring.
+    """
+
+    def __init__(self, n_lists: int = None, nprobe: int = 8,
+                 min_train_size: int = 10000, max_train_size: int = 100000):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.max_train_size = max_train_size
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, store: VectorStore, block_rows: int = 65536):
+        """Fit centroids on (a sample of) the store and bucket every row"""
+        n = len(store)
+        k = self.n_lists or max(1, int(4 * np.sqrt(n)))
+        k = min(k, n)
+        sample = None
+        if n > self.max_train_size:
+            sample = np.sort(np.random.default_rng(0).choice(n, size=self.max_train_size,
+                                                             replace=False))
+        self.centroids = spherical_kmeans(store.vectors(sample), k)
+        self._lists = [[] for _ in range(k)]
+        self._list_arrays = [None] * k
+        for start in range(0, n, block_rows):
+            rows = np.arange(start, min(start + block_rows, n))
+            self.add(rows, store.vectors(rows))
+
+    def add(self, rows, vectors: np.ndarray):
+        """Bucket newly stored rows (no-op until trained)"""
+        if not self.trained:
+            return
+        assignment = np.argmax(np.atleast_2d(vectors) @ self.centroids.T, axis=1)
+        for row, bucket in zip(np.atleast_1d(rows), assignment):
+            self._lists[bucket].append(int(row))
+            self._list_arrays[bucket] = None
+
+    def remap(self, keep: np.ndarray, size: int):
+        """Renumber rows after store.compact() (old row keep[i] becomes i, other rows
+        of the old size leave their lists); the centroids stay, nothing is retrained"""
+        if not self.trained:
+            return
+        new_row = np.full(size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        for i, rows in enumerate(self._lists):
+            mapped = new_row[np.array(rows, dtype=np.int64)]
+            self._lists[i] = mapped[mapped >= 0].tolist()
+            self._list_arrays[i] = None
+
+    def maybe_train(self, store: VectorStore):
+        if not self.trained and len(store) >= self.min_train_size:
+            self.train(store)
+
+    def _bucket(self, i: int) -> np.ndarray:
+        if self._list_arrays[i] is None:
+            self._list_arrays[i] = np.array(self._lists[i], dtype=np.int64)
+        return self._list_arrays[i]
+
+    def candidates(self, query: np.ndarray, nprobe: int = None) -> np.ndarray:
+        """Rows in the nprobe buckets closest to the (normalised) query"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate([self._bucket(int(i)) for i in probes])
+
+    def search(self, query: np.ndarray, store: VectorStore, top_k: int = 3,
+               nprobe: int = None) -> List[Tuple[int, float]]:
+        if not self.trained:
+            return store.search(query, top_k)
+        query = normalize(query)
+        rows = self.candidates(query, nprobe)
+        scores = store.mask_deleted(store.score(query, rows), rows)
+        best = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+
+# ================= BENCHMARK =================
+def benchmark(n: int = 200000, dim: int = 256, queries: int = 200, top_k: int = 10):
+    """Recall@k and latency of IVF vs exact search on clustered synthetic data"""
+    rng = np.random.default_rng(42)
+    centers = rng.standard_normal((1000, dim)).astype(np.float32)
+    data = normalize(centers[rng.integers(0, 1000, n)] +
+                     0.5 * rng.standard_normal((n, dim)).astype(np.float32))
+    query_set = normalize(data[rng.choice(n, queries, replace=False)] +
+                          0.1 * rng.standard_normal((queries, dim)).astype(np.float32))
+
+    start = time.perf_counter()
+    exact = [set(top_k_indices(data @ q, top_k).tolist()) for q in query_set]
+    exact_ms = (time.perf_counter() - start) * 1000 / queries
+
+    store = VectorStore()
+    store.add(data)
+    index = IVFIndex()
+    start = time.perf_counter()
+    index.train(store)
+    print(f"📐 {n} x {dim}, {len(index.centroids)} lists, "
+          f"trained in {time.perf_counter() - start:.1f}s")
+    print(f"   exact search: {exact_ms:.2f} ms/query")
+
+    for nprobe in (1, 4, 8, 16, 32, 64):
+        start = time.perf_counter()
+        found = [{r for r, _ in index.search(q, store, top_k, nprobe)} for q in query_set]
+        ms = (time.perf_counter() - start) * 1000 / queries
+        recall = np.mean([len(f & e) / top_k for f, e in zip(found, exact)])
+        print(f"   nprobe={nprobe:<3} recall@{top_k}={recall:.3f}  {ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    benchmark()
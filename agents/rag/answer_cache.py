@@ -0,0 +1,116 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional
+import numpy as np
+from vector_store import normalize
+
+
+class AnswerCache:
+    """Semantic cache of generated answers.
+
+    A new question reuses a cached answer when its embedding is within
+    similarity_threshold (cosine) of a cached question asked with the same
+    retrieval key (top_k, filters), the entry is younger than ttl_seconds and the
+    documents it was answered from are unchanged. Results are copied in and out,
+    so callers can't change what later lookups return.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1000,
+                 ttl_seconds: float = 3600):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._matrix = None  # cached query embeddings, rebuilt lazily
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def _index(self):
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries)
+            self._matrix = (np.stack([self._entries[i]["embedding"] for i in self._matrix_ids])
+                            if self._entries else None)
+        return self._matrix, self._matrix_ids
+
+    def _drop(self, entry_id: int):
+        del self._entries[entry_id]
+        self._matrix = None
+
+    def lookup(self, query_embedding: np.ndarray, key: Hashable,
+               is_valid: Callable[[Iterable[str]], bool] = None) -> Optional[Dict]:
+        """Cached answer for the closest similar question, or None"""
+        with self._lock:
+            matrix, ids = self._index()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            scores = matrix @ normalize(query_embedding)
+            now = time.time()
+            for i in np.argsort(-scores):
+                if scores[i] < self.similarity_threshold:
+                    break
+                entry_id = ids[i]
+                entry = self._entries[entry_id]
+                if entry["key"] != key:
+                    continue
+                if now - entry["created"] > self.ttl_seconds:
+                    self._drop(entry_id)
+                    self.expired += 1
+                    continue
+                if is_valid is not None and not is_valid(entry["doc_ids"]):
+                    self._drop(entry_id)
+                    self.invalidated += 1
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return copy.deepcopy(entry["result"])
+
+            self.misses += 1
+            return None
+
+    def put(self, query_embedding: np.ndarray, key: Hashable, doc_ids: Iterable[str],
+            result: Dict):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "embedding": normalize(query_embedding),
+                "key": key,
+                "doc_ids": tuple(doc_ids),
+                "result": copy.deepcopy(result),
+                "created": time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate_document(self, doc_id: str):
+        """Drop every cached answer that was built from this document"""
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if doc_id in e["doc_ids"]]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self.invalidated += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "invalidated": self.invalidated
+        }
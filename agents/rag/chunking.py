@@ -0,0 +1,204 @@
+import io
+import mmap
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Iterable, Iterator, TextIO, Tuple
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+SENTENCE_BOUNDARY_BYTES = re.compile(rb'(?<=[.!?])\s+')
+WHITESPACE_BYTES = b" \t\n\r\x0b\x0c"
+READ_BLOCK_SIZE = 1 << 16
+
+
+def _split_long_sentence(sentence: str, max_sentence: int) -> Iterator[str]:
+    """Cut a sentence longer than max_sentence at whitespace (or hard, if there is none)"""
+    while len(sentence) > max_sentence:
+        cut = sentence.rfind(" ", 0, max_sentence)
+        cut = cut if cut > 0 else max_sentence
+        yield sentence[:cut]
+        sentence = sentence[cut:].lstrip()
+    if sentence:
+        yield sentence
+
+
+def iter_sentences(stream: TextIO, max_sentence: int = 4096,
+                   block_size: int = READ_BLOCK_SIZE) -> Iterator[str]:
+    """Yield sentences from a text stream, reading it block by block.
+
+    Sentences longer than max_sentence characters (e.g. log dumps with no sentence
+    punctuation) are cut at whitespace, the same way wherever the read blocks
+    happen to end, so the buffer never grows unbounded.
+    """
+    buffer = ""
+    while True:
+        block = stream.read(block_size)
+        buffer += block
+
+        last_end = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            # A boundary touching the end of the buffer may continue in the next block
+            if block and match.end() == len(buffer):
+                break
+            yield from _split_long_sentence(buffer[last_end:match.start()], max_sentence)
+            last_end = match.end()
+        buffer = buffer[last_end:]
+
+        # A long unfinished sentence: emit the pieces _split_long_sentence would
+        while len(buffer) > max_sentence:
+            cut = buffer.rfind(" ", 0, max_sentence)
+            cut = cut if cut > 0 else max_sentence
+            yield buffer[:cut]
+            buffer = buffer[cut:].lstrip()
+
+        if not block:
+            break
+
+    yield from _split_long_sentence(buffer.strip(), max_sentence)
+
+
+def iter_chunks(sentences: Iterable[str], chunk_size: int = 500,
+                overlap: int = 0) -> Iterator[str]:
+    """Group sentences into chunks of about chunk_size characters.
+
+    The last sentences of each chunk, up to overlap characters, are repeated at the
+    start of the next one.
+    """
+    current = deque()
+    length = 0  # characters in current, counting one separating space per sentence
+
+    for sentence in sentences:
+        if current and length + len(sentence) > chunk_size:
+            yield " ".join(current)
+            while current and length > overlap:
+                length -= len(current.popleft()) + 1
+            while current and length + len(sentence) > chunk_size:
+                length -= len(current.popleft()) + 1
+        current.append(sentence)
+        length += len(sentence) + 1
+
+    if current:
+        yield " ".join(current)
+
+
+def iter_text_chunks(text: str, chunk_size: int = 500, overlap: int = 0) -> Iterator[str]:
+    return iter_chunks(iter_sentences(io.StringIO(text), max_sentence=chunk_size),
+                       chunk_size, overlap)
+
+
+def iter_file_chunks(filepath: str, chunk_size: int = 500, overlap: int = 0,
+                     encoding: str = "utf-8") -> Iterator[str]:
+    """Stream sentence-bounded chunks from a file without reading it all at once"""
+    with open(filepath, "r", encoding=encoding) as f:
+        yield from iter_chunks(iter_sentences(f, max_sentence=chunk_size), chunk_size, overlap)
+
+
+# ================= BYTE SPANS =================
+# Zero-copy variants: chunks are (start, end) byte offsets into a UTF-8 buffer such
+# as a memory-mapped file, and the text between them is kept exactly as in the file.
+
+def map_file(filepath: str):
+    """Read-only mmap of a file (b"" for an empty file)"""
+    with open(filepath, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedFilePool:
+    """Bounded LRU of read-only file maps, so documents from any number of files
+    hold at most max_open maps (and descriptors) at a time; a file evicted from
+    the pool is mapped again on its next read."""
+
+    def __init__(self, max_open: int = 64):
+        self.max_open = max(1, max_open)
+        self._maps: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path: str, key: slice) -> bytes:
+        # Sliced under the lock, so another thread can't close the map mid-read
+        with self._lock:
+            buffer = self._maps.get(path)
+            if buffer is None:
+                buffer = self._maps[path] = map_file(path)
+                while len(self._maps) > self.max_open:
+                    _, evicted = self._maps.popitem(last=False)
+                    if isinstance(evicted, mmap.mmap):
+                        evicted.close()
+            else:
+                self._maps.move_to_end(path)
+            return buffer[key]
+
+    def close(self):
+        with self._lock:
+            for buffer in self._maps.values():
+                if isinstance(buffer, mmap.mmap):
+                    buffer.close()
+            self._maps.clear()
+
+
+class MappedFile:
+    """A file's bytes, sliced through a MappedFilePool; holds no map of its own"""
+    __slots__ = ("path", "pool")
+
+    def __init__(self, path: str, pool: MappedFilePool):
+        self.path = path
+        self.pool = pool
+
+    def __getitem__(self, key: slice) -> bytes:
+        return self.pool.read(self.path, key)
+
+
+def _strip(buffer, start: int, end: int) -> Tuple[int, int]:
+    while start < end and buffer[start] in WHITESPACE_BYTES:
+        start += 1
+    while end > start and buffer[end - 1] in WHITESPACE_BYTES:
+        end -= 1
+    return start, end
+
+
+def _split_long(buffer, start: int, end: int, max_sentence: int) -> Iterator[Tuple[int, int]]:
+    start, end = _strip(buffer, start, end)
+    while end - start > max_sentence:
+        cut = buffer.rfind(b" ", start, start + max_sentence)
+        if cut <= start:
+            cut = start + max_sentence
+            while buffer[cut] & 0xC0 == 0x80:  # don't split a UTF-8 sequence
+                cut -= 1
+        yield _strip(buffer, start, cut)
+        start, end = _strip(buffer, cut, end)
+    if end > start:
+        yield start, end
+
+
+def iter_sentence_spans(buffer, max_sentence: int = 4096) -> Iterator[Tuple[int, int]]:
+    """Byte spans of the sentences in a UTF-8 buffer; the buffer is never copied"""
+    last_end = 0
+    for match in SENTENCE_BOUNDARY_BYTES.finditer(buffer):
+        yield from _split_long(buffer, last_end, match.start(), max_sentence)
+        last_end = match.end()
+    yield from _split_long(buffer, last_end, len(buffer), max_sentence)
+
+
+def iter_chunk_spans(spans: Iterable[Tuple[int, int]], chunk_size: int = 500,
+                     overlap: int = 0) -> Iterator[Tuple[int, int]]:
+    """iter_chunks over sentence spans: each chunk is one contiguous byte range"""
+    current = deque()
+
+    for start, end in spans:
+        if current and end - current[0][0] > chunk_size:
+            yield current[0][0], current[-1][1]
+            while current and current[-1][1] - current[0][0] > overlap:
+                current.popleft()
+            while current and end - current[0][0] > chunk_size:
+                current.popleft()
+        current.append((start, end))
+
+    if current:
+        yield current[0][0], current[-1][1]
+
+
+def iter_buffer_chunk_spans(buffer, chunk_size: int = 500,
+                            overlap: int = 0) -> Iterator[Tuple[int, int]]:
+    return iter_chunk_spans(iter_sentence_spans(buffer, max_sentence=chunk_size),
+                            chunk_size, overlap)
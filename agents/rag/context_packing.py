@@ -0,0 +1,87 @@
+from typing import List, Tuple
+import numpy as np
+from chunking import SENTENCE_BOUNDARY
+
+CHARS_PER_TOKEN = 4  # same rough estimate the guardrails use
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _cut_to_words(text: str, max_chars: int) -> str:
+    """Prefix of text of at most max_chars, ending at a word boundary if there is one"""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars + 1)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+
+def mmr_order(relevance: np.ndarray, embeddings: np.ndarray, diversity: float = 0.3) -> List[int]:
+    """Maximal-marginal-relevance ordering of candidates.
+
+    Each step picks argmax((1 - diversity) * relevance - diversity * max similarity to
+    anything already picked); the max-similarity vector is updated with one column of
+    the similarity matrix per pick.
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    span = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / (span if span > 0 else 1.0)
+    similarity = embeddings @ embeddings.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(n):
+        penalty = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = (1 - diversity) * relevance - diversity * penalty
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        available[pick] = False
+        max_similarity = np.maximum(max_similarity, similarity[:, pick])
+    return order
+
+
+def pack_context(passages: List[str], relevance, embeddings: np.ndarray = None,
+                 token_budget: int = 1500, diversity: float = 0.3) -> List[Tuple[int, str]]:
+    """Select passages for a prompt within token_budget.
+
+    Passages are taken in MMR order (relevance order without embeddings). Sentences
+    already included from an earlier passage (e.g. chunk overlap) are dropped, and
+    the last passage that doesn't fit is cut at a sentence boundary (or, when not
+    even its first sentence fits, at a word boundary). Returns (passage index,
+    packed text) pairs.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    if embeddings is not None and len(passages) > 1:
+        order = mmr_order(relevance, np.asarray(embeddings, dtype=np.float32), diversity)
+    else:
+        order = [int(i) for i in np.argsort(-relevance, kind="stable")]
+
+    seen = set()
+    packed = []
+    remaining = token_budget
+    for i in order:
+        kept = []
+        for sentence in SENTENCE_BOUNDARY.split(passages[i]):
+            key = " ".join(sentence.lower().split())
+            if not key or key in seen:
+                continue
+            cost = estimate_tokens(sentence)
+            if cost > remaining:
+                if not kept:
+                    cut = _cut_to_words(sentence, remaining * CHARS_PER_TOKEN)
+                    if cut:
+                        kept.append(cut)
+                        remaining = 0
+                break
+            seen.add(key)
+            kept.append(sentence)
+            remaining -= cost
+        if kept:
+            packed.append((i, " ".join(kept)))
+        if remaining <= 0:
+            break
+    return packed
@@ -0,0 +1,114 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional, Set
+import numpy as np
+
+HASH_MASK = np.uint64(0xFFFFFFFF)
+
+
+def shingles(text: str, size: int = 5) -> Set[str]:
+    """Overlapping word n-grams of whitespace/case-normalised text"""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHashDeduplicator:
+    """Near-duplicate detection with MinHash signatures and LSH banding.
+
+    Each text gets a num_perm MinHash signature over its word shingles; the
+    fraction of equal signature slots estimates Jaccard similarity. Signatures are
+    split into bands, and only texts sharing a band bucket are compared, so a
+    lookup costs O(bands) regardless of how many texts are indexed. Texts are only
+    compared with others indexed under the same scope.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: ((a * x + b) mod 2**64) >> 32, with odd a
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._scopes: Dict[str, str] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+             for s in shingles(text, self.shingle_size)),
+            dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            permuted = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return (permuted & HASH_MASK).min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, scope: str) -> List[bytes]:
+        prefix = scope.encode("utf-8") + b"\0"
+        return [prefix + band.tobytes() for band in np.split(signature, self.bands)]
+
+    def _find(self, signature: np.ndarray, scope: str) -> Optional[str]:
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._band_keys(signature, scope)):
+            candidates |= buckets.get(key, set())
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def find(self, text: str, scope: str = "") -> Optional[str]:
+        """Key of the most similar text in scope at or above threshold, or None"""
+        signature = self.signature(text)
+        with self._lock:
+            return self._find(signature, scope)
+
+    def add(self, key: str, text: str, scope: str = ""):
+        signature = self.signature(text)
+        with self._lock:
+            self._add(key, signature, scope)
+
+    def _add(self, key: str, signature: np.ndarray, scope: str):
+        self._signatures[key] = signature
+        self._scopes[key] = scope
+        for buckets, band in zip(self._buckets, self._band_keys(signature, scope)):
+            buckets.setdefault(band, set()).add(key)
+
+    def claim(self, key: str, text: str, scope: str = "") -> Optional[str]:
+        """Atomically find a near-duplicate of text, or index it under key.
+
+        Returns the duplicate's key, or None when text was new (and is now indexed).
+        """
+        signature = self.signature(text)
+        with self._lock:
+            duplicate = self._find(signature, scope)
+            if duplicate is None:
+                self._add(key, signature, scope)
+            return duplicate
+
+    def remove(self, key: str):
+        with self._lock:
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return
+            scope = self._scopes.pop(key)
+            for buckets, band in zip(self._buckets, self._band_keys(signature, scope)):
+                keys = buckets.get(band)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del buckets[band]
@@ -0,0 +1,139 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies share a cache entry"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-memory LRU with an optional SQLite disk tier.
+
+    Entries are keyed by sha256(model + normalised text), so the same string embedded
+    by different call sites (agents, universal_client) is only sent to the API once.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_path: str = None,
+                 max_disk_entries: int = 1000000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB, last_used REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    # ================= MEMORY TIER =================
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ================= DISK TIER =================
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def _disk_put(self, key: str, vector: np.ndarray):
+        self._db.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            (key, vector.tobytes(), time.time())
+        )
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
+        self._db.commit()
+
+    # ================= PUBLIC API =================
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                vector = self._disk_get(key)
+                if vector is not None:
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        key = self.make_key(model, text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._disk_put(key, vector)
+        return vector
+
+    def get_or_embed(self, model: str, texts: List[str],
+                     embed_fn: Callable[[List[str]], List]) -> List[np.ndarray]:
+        """Look up every text; call embed_fn once with just the misses"""
+        results: List[Optional[np.ndarray]] = [self.get(model, t) for t in texts]
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            fresh = embed_fn([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                results[i] = self.put(model, texts[i], embedding)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+
+_default_cache: Optional[EmbeddingCache] = None
+
+
+def get_default_cache() -> EmbeddingCache:
+    """Process-wide cache shared by every embedding call site"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
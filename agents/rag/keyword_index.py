@@ -0,0 +1,266 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from vector_store import top_k_indices, save_npy, save_json
+
+# Keeps identifiers such as "os.path.join", "err_conn_reset" or "e-1234" whole
+TOKEN_PATTERN = re.compile(r"\w[\w.\-]*\w|\w")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def whitespace_tokenize(text: str) -> List[str]:
+    """The lower().split() tokenization used by the keyword SimpleRAGAgents"""
+    return text.lower().split()
+
+
+TOKENIZERS = {"tokenize": tokenize, "whitespace_tokenize": whitespace_tokenize}
+
+
+class InvertedIndex:
+    """Term -> postings (document ids, term frequencies) with BM25 scoring.
+
+    Document ids are small non-negative integers (list positions or store rows).
+    An index opened from a snapshot keeps its postings memory-mapped in CSR form;
+    documents added afterwards go to in-memory postings on top.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = tokenize):
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_lengths = np.full(0, -1, dtype=np.float32)  # -1 = no such document
+        self._doc_count = 0
+        self._total_length = 0
+        self._deleted = set()
+        # Memory-mapped CSR postings of an opened snapshot
+        self._frozen_terms: Dict[str, int] = {}
+        self._frozen = None
+
+    def __len__(self):
+        return self._doc_count - len(self._deleted)
+
+    def add(self, doc_id: int, text: str):
+        """Tokenize once and append to the postings of every distinct term"""
+        counts = Counter(self.tokenizer(text))
+        for term, tf in counts.items():
+            ids, tfs = self._postings.setdefault(term, ([], []))
+            ids.append(doc_id)
+            tfs.append(tf)
+            self._arrays.pop(term, None)
+
+        if doc_id >= len(self._doc_lengths):
+            grown = np.full(max(doc_id + 1, 2 * len(self._doc_lengths), 1024), -1,
+                            dtype=np.float32)
+            grown[:len(self._doc_lengths)] = self._doc_lengths
+            self._doc_lengths = grown
+        length = sum(counts.values())
+        self._doc_lengths[doc_id] = length
+        self._doc_count += 1
+        self._total_length += length
+
+    def remove(self, doc_id: int):
+        """Exclude a document from scoring; its postings stay until the index is rebuilt"""
+        if (doc_id < len(self._doc_lengths) and self._doc_lengths[doc_id] >= 0
+                and doc_id not in self._deleted):
+            self._deleted.add(doc_id)
+            self._total_length -= int(self._doc_lengths[doc_id])
+
+    def remap(self, keep: np.ndarray, size: int):
+        """Renumber documents after their store dropped rows: old id keep[i] becomes i
+        and other ids below size leave the postings, without re-tokenizing any text"""
+        new_id = np.full(max(size, len(self._doc_lengths)), -1, dtype=np.int64)
+        new_id[keep] = np.arange(len(keep))
+
+        if self._frozen is not None:
+            offsets, ids, tfs = self._frozen
+            mapped = new_id[ids]
+            live = mapped >= 0
+            kept_before = np.concatenate(([0], np.cumsum(live)))
+            self._frozen = (kept_before[offsets], mapped[live], np.asarray(tfs)[live])
+        for term, (ids, tfs) in list(self._postings.items()):
+            mapped = new_id[np.array(ids, dtype=np.int64)]
+            live = mapped >= 0
+            if live.any():
+                self._postings[term] = (mapped[live].tolist(), np.array(tfs)[live].tolist())
+            else:
+                del self._postings[term]
+        self._arrays.clear()
+
+        lengths = np.full(len(new_id), -1, dtype=np.float32)
+        lengths[:len(self._doc_lengths)] = self._doc_lengths
+        self._doc_lengths = lengths[keep]
+        self._deleted = {int(new_id[doc_id]) for doc_id in self._deleted if new_id[doc_id] >= 0}
+        present = self._doc_lengths >= 0
+        self._doc_count = int(present.sum())
+        self._total_length = int(self._doc_lengths[present].sum()) - sum(
+            int(self._doc_lengths[doc_id]) for doc_id in self._deleted)
+
+    def _has_term(self, term: str) -> bool:
+        return term in self._postings or term in self._frozen_terms
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        if term not in self._arrays:
+            id_parts, tf_parts = [], []
+            if term in self._frozen_terms:
+                offsets, ids, tfs = self._frozen
+                slot = self._frozen_terms[term]
+                id_parts.append(ids[offsets[slot]:offsets[slot + 1]])
+                tf_parts.append(tfs[offsets[slot]:offsets[slot + 1]])
+            if term in self._postings:
+                ids, tfs = self._postings[term]
+                id_parts.append(np.array(ids, dtype=np.int64))
+                tf_parts.append(np.array(tfs, dtype=np.float32))
+            self._arrays[term] = (np.concatenate(id_parts).astype(np.int64, copy=False),
+                                  np.concatenate(tf_parts).astype(np.float32, copy=False))
+        return self._arrays[term]
+
+    def _lengths(self) -> np.ndarray:
+        """Document lengths indexed by doc id"""
+        return self._doc_lengths
+
+    def bm25(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 scores for every document containing a query term, as (ids, scores)"""
+        n = len(self)
+        terms = [t for t in set(self.tokenizer(query)) if self._has_term(t)]
+        if not terms or n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        avg_length = self._total_length / n or 1.0
+        lengths = self._lengths()
+        all_ids, all_scores = [], []
+        for term in terms:
+            ids, tfs = self._term_arrays(term)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[ids] / avg_length)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if self._deleted:
+            live = ~np.isin(ids, np.fromiter(self._deleted, dtype=np.int64))
+            ids, scores = ids[live], scores[live]
+        return ids, scores
+
+    def search(self, query: str, top_k: int = 10,
+               allowed: np.ndarray = None) -> List[Tuple[int, float]]:
+        """Top-k by BM25, optionally restricted to the allowed document ids"""
+        ids, scores = self.bm25(query)
+        if allowed is not None:
+            keep = np.isin(ids, allowed)
+            ids, scores = ids[keep], scores[keep]
+        return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def overlap_search(self, query: str, top_k: int = 3) -> List[Tuple[int, int]]:
+        """Top-k documents by how many distinct query terms they contain.
+
+        Only the postings of the query's own terms are read; ties go to the earlier
+        document.
+        """
+        terms = [t for t in set(self.tokenizer(query)) if self._has_term(t)]
+        if not terms:
+            return []
+        ids, counts = np.unique(np.concatenate([self._term_arrays(t)[0] for t in terms]),
+                                return_counts=True)
+        hits = ((int(doc_id), int(count)) for doc_id, count in zip(ids, counts)
+                if doc_id not in self._deleted)
+        return heapq.nlargest(top_k, hits, key=lambda x: (x[1], -x[0]))
+
+    # ================= SNAPSHOTS =================
+    def save(self, directory: str):
+        """Write postings as CSR arrays (vocab.json + .npy files) that open() maps"""
+        os.makedirs(directory, exist_ok=True)
+        vocabulary = sorted(set(self._postings) | set(self._frozen_terms))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        id_parts, tf_parts = [], []
+        for i, term in enumerate(vocabulary):
+            ids, tfs = self._term_arrays(term)
+            id_parts.append(ids)
+            tf_parts.append(tfs)
+            offsets[i + 1] = offsets[i] + len(ids)
+
+        def concat(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+        save_npy(os.path.join(directory, "postings_offsets.npy"), offsets)
+        save_npy(os.path.join(directory, "postings_ids.npy"), concat(id_parts, np.int64))
+        save_npy(os.path.join(directory, "postings_tfs.npy"), concat(tf_parts, np.float32))
+        save_npy(os.path.join(directory, "doc_lengths.npy"), self._doc_lengths)
+        save_json(os.path.join(directory, "keyword_index.json"), {
+            "tokenizer": self.tokenizer.__name__,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_count": self._doc_count,
+            "total_length": self._total_length,
+            "deleted": sorted(self._deleted),
+            "vocabulary": vocabulary
+        }, separators=(",", ":"))
+
+    @classmethod
+    def open(cls, directory: str) -> "InvertedIndex":
+        """Open a snapshot; only the vocabulary is parsed, postings stay mapped"""
+        with open(os.path.join(directory, "keyword_index.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["tokenizer"] not in TOKENIZERS:
+            raise ValueError(f"Unknown tokenizer in snapshot: {meta['tokenizer']}")
+        index = cls(meta["k1"], meta["b"], TOKENIZERS[meta["tokenizer"]])
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        index._frozen = (load("postings_offsets.npy"), load("postings_ids.npy"),
+                         load("postings_tfs.npy"))
+        index._frozen_terms = {term: i for i, term in enumerate(meta["vocabulary"])}
+        # Copied so that later add() calls can write into it
+        index._doc_lengths = np.array(load("doc_lengths.npy"))
+        index._doc_count = meta["doc_count"]
+        index._total_length = meta["total_length"]
+        index._deleted = set(meta["deleted"])
+        return index
+
+
+# ================= SCORE FUSION =================
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]],
+                           k: int = 60) -> List[Tuple[int, float]]:
+    """Sum 1 / (k + rank) over each ranked list"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def weighted_fusion(dense: List[Tuple[int, float]], sparse: List[Tuple[int, float]],
+                    dense_weight: float = 0.5) -> List[Tuple[int, float]]:
+    """Min-max normalise each list and blend: w * dense + (1 - w) * sparse.
+
+    A list whose scores are all equal (e.g. one BM25 hit, or tied exact identifier
+    matches) scales to 1.0, so its hits still count in full.
+    """
+    def scaled(results):
+        if not results:
+            return {}
+        scores = [s for _, s in results]
+        low, high = min(scores), max(scores)
+        if high == low:
+            return {doc_id: 1.0 for doc_id, _ in results}
+        return {doc_id: (s - low) / (high - low) for doc_id, s in results}
+
+    dense_scores, sparse_scores = scaled(dense), scaled(sparse)
+    fused = {
+        doc_id: dense_weight * dense_scores.get(doc_id, 0.0)
+        + (1 - dense_weight) * sparse_scores.get(doc_id, 0.0)
+        for doc_id in set(dense_scores) | set(sparse_scores)
+    }
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,87 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Set
+import numpy as np
+
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+
+class MetadataIndex:
+    """Secondary index from metadata (field, value) to store rows.
+
+    Filters map a field to a value (equality, or membership for list fields such as
+    tags), a list of values (any of), or a range dict using gt/gte/lt/lte (works for
+    numbers and ISO date strings).
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {}
+        self._sorted_keys: Dict[str, List[Any]] = {}
+
+    @staticmethod
+    def _values(value) -> List[Any]:
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        return [v for v in values if isinstance(v, (str, int, float, bool))]
+
+    def add(self, row: int, metadata: Dict):
+        for field, value in metadata.items():
+            postings = self._postings.setdefault(field, {})
+            for v in self._values(value):
+                postings.setdefault(v, set()).add(row)
+            self._sorted_keys.pop(field, None)
+
+    def remove(self, row: int, metadata: Dict):
+        for field, value in metadata.items():
+            postings = self._postings.get(field, {})
+            for v in self._values(value):
+                rows = postings.get(v)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del postings[v]
+                        self._sorted_keys.pop(field, None)
+
+    def _range(self, field: str, bounds: Dict) -> Set[int]:
+        postings = self._postings.get(field, {})
+        if field not in self._sorted_keys:
+            try:
+                self._sorted_keys[field] = sorted(postings)
+            except TypeError:  # mixed value types can't be range-filtered
+                self._sorted_keys[field] = []
+        keys = self._sorted_keys[field]
+
+        lo, hi = 0, len(keys)
+        if "gte" in bounds:
+            lo = bisect_left(keys, bounds["gte"])
+        if "gt" in bounds:
+            lo = max(lo, bisect_right(keys, bounds["gt"]))
+        if "lte" in bounds:
+            hi = bisect_right(keys, bounds["lte"])
+        if "lt" in bounds:
+            hi = min(hi, bisect_left(keys, bounds["lt"]))
+
+        rows: Set[int] = set()
+        for key in keys[lo:hi]:
+            rows |= postings[key]
+        return rows
+
+    def _match(self, field: str, condition) -> Set[int]:
+        postings = self._postings.get(field, {})
+        if isinstance(condition, dict):
+            unknown = set(condition) - set(RANGE_OPERATORS)
+            if unknown:
+                raise ValueError(f"Unknown filter operators for {field}: {sorted(unknown)}")
+            return self._range(field, condition)
+        rows: Set[int] = set()
+        for value in self._values(condition):
+            rows |= postings.get(value, set())
+        return rows
+
+    def filter(self, filters: Dict) -> np.ndarray:
+        """Sorted rows matching every condition (AND across fields)"""
+        matched = None
+        # Intersect the most selective conditions first
+        for rows in sorted((self._match(f, c) for f, c in filters.items()), key=len):
+            matched = rows if matched is None else matched & rows
+            if not matched:
+                break
+        return np.array(sorted(matched or ()), dtype=np.int64)
@@ -1,7 +1,10 @@
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import List
+from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from keyword_index import InvertedIndex, whitespace_tokenize
+from text_store import save_texts, MappedTexts
 
 load_dotenv()
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
@@ -12,35 +15,47 @@ class SimpleRAGAgent:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-2.5-flash')
         self.knowledge_base: List[str] = []
+        self.index = InvertedIndex(tokenizer=whitespace_tokenize)
     
     def add_knowledge(self, text: str):
-        """Add document to knowledge base"""
+        """Add document to knowledge base (tokenized once into the inverted index)"""
+        self.index.add(len(self.knowledge_base), text)
         self.knowledge_base.append(text)
     
+    def save_snapshot(self, directory: str):
+        """Save the knowledge base and its token index to a mappable snapshot"""
+        save_texts(directory, self.knowledge_base)
+        self.index.save(directory)
+    
+    def load_snapshot(self, directory: str):
+        """Replace the knowledge base with a snapshot; texts are decoded lazily"""
+        self.index = InvertedIndex.open(directory)
+        self.knowledge_base = MappedTexts(directory)
+    
     def retrieve_relevant_context(self, query: str, top_k: int = 3) -> str:
         """Simple keyword-based retrieval"""
+        return self._retrieve(query, top_k)[0]
+    
+    def _retrieve(self, query: str, top_k: int = 3) -> Tuple[str, List[str]]:
+        """(context for the prompt, documents it was built from)"""
         if not self.knowledge_base:
-            return "No knowledge base available."
-        
-        # Simple scoring based on keyword overlap
-        query_words = set(query.lower().split())
-        scored_docs = []
-        
-        for doc in self.knowledge_base:
-            doc_words = set(doc.lower().split())
-            score = len(query_words & doc_words)
-            scored_docs.append((score, doc))
+            return "No knowledge base available.", []
         
-        # Sort by score and get top_k
-        scored_docs.sort(reverse=True, key=lambda x: x[0])
-        relevant_docs = [doc for score, doc in scored_docs[:top_k] if score > 0]
+        # Score = number of distinct query words in the doc, read from postings
+        hits = self.index.overlap_search(query, top_k)
+        relevant_docs = [self.knowledge_base[doc_id] for doc_id, score in hits]
         
-        return "\n\n".join(relevant_docs) if relevant_docs else "No relevant information found."
+        context = "\n\n".join(relevant_docs) if relevant_docs else "No relevant information found."
+        return context, relevant_docs
     
     def answer_question(self, question: str) -> str:
         """Answer question using RAG"""
+        return self._answer(question)[0]
+    
+    def _answer(self, question: str) -> Tuple[str, List[str]]:
+        """(answer, retrieved documents)"""
         # Retrieve relevant context
-        context = self.retrieve_relevant_context(question)
+        context, sources = self._retrieve(question)
         
         # Build prompt
         prompt = f"""Based on the following context, answer the question.
@@ -54,7 +69,25 @@ Answer:"""
         
         # Generate response
         response = self.model.generate_content(prompt)
-        return response.text
+        return response.text, sources
+    
+    def answer_questions(self, questions: List[str], max_concurrency: int = 8) -> List[Dict]:
+        """Answer many questions with up to max_concurrency generation calls in flight.
+        
+        Results ({"question", "answer", "sources", "error"}, as from
+        AdvancedRAGAgent.answer_questions) are returned in input order; a failing
+        question gets an "error" instead of failing the whole batch.
+        """
+        def answer(question: str) -> Dict:
+            try:
+                text, sources = self._answer(question)
+                return {"question": question, "answer": text,
+                        "sources": [doc[:100] for doc in sources], "error": None}
+            except Exception as e:
+                return {"question": question, "answer": None, "sources": [], "error": str(e)}
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(answer, questions))
 
 # Test
 if __name__ == "__main__":
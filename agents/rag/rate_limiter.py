@@ -0,0 +1,24 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls to at most requests_per_minute"""
+
+    def __init__(self, requests_per_minute: float):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until this caller's slot in the schedule arrives"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,198 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from vector_store import VectorStore, STORAGE_DTYPES, normalize
+
+# Shared blocks (or mapped .npy files) attached by this worker process, keyed by
+# block name (or path@mtime); the block is None for files
+_attached: Dict[str, Tuple[Optional[shared_memory.SharedMemory], np.ndarray]] = {}
+
+
+def _attach(name: str, shape: Tuple, dtype) -> np.ndarray:
+    if name not in _attached:
+        block = shared_memory.SharedMemory(name=name)
+        _attached[name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    return _attached[name][1]
+
+
+def _map(name: str) -> np.ndarray:
+    """Memory-map a saved .npy read-only; the OS page cache is shared with the parent"""
+    if name not in _attached:
+        _attached[name] = (None, np.load(name.rsplit("@", 1)[0], mmap_mode="r"))
+    return _attached[name][1]
+
+
+def _release(keep):
+    """Unmap blocks and files of an earlier publish"""
+    for name in [n for n in _attached if n not in keep]:
+        block, array = _attached.pop(name)
+        del array
+        if block is not None:
+            block.close()
+
+
+def _search_shard(layout: Dict, start: int, end: int, queries: np.ndarray,
+                  top_k: int) -> List[List[Tuple[int, float]]]:
+    """Worker: top-k over rows [start, end) of the shared matrix"""
+    names = [layout["matrix"], layout["deleted"]] + ([layout["scales"]] if layout["scales"] else [])
+    _release(names)
+    size, dim = layout["size"], layout["dim"]
+    if layout["mapped"]:
+        matrix = _map(layout["matrix"])
+        scales = _map(layout["scales"]) if layout["scales"] else None
+    else:
+        matrix = _attach(layout["matrix"], (size, dim), STORAGE_DTYPES[layout["dtype"]])
+        scales = _attach(layout["scales"], (size,), np.float32) if layout["scales"] else None
+    shard = VectorStore(dtype=layout["dtype"])
+    shard.dim = dim
+    shard.size = end - start
+    shard._matrix = matrix[start:end]
+    shard._deleted = _attach(layout["deleted"], (size,), bool)[start:end]
+    shard.deleted_count = int(shard._deleted.sum()) if layout["deleted_count"] else 0
+    if scales is not None:
+        shard._scales = scales[start:end]
+    return [[(row + start, score) for row, score in hits]
+            for hits in shard.search_many(queries, top_k)]
+
+
+class ShardedSearch:
+    """Exact top-k over a VectorStore split into row shards, one per worker process.
+
+    The matrix is published once into shared memory that every worker maps, so
+    each query block costs one small message per shard plus the merged top-k
+    lists. Publishing copies the matrix, so it is held twice in RAM while the
+    store keeps its own rows; a store opened with VectorStore.open is instead
+    mapped by the workers straight from its saved .npy files (no copy) for as long
+    as those rows are unchanged on disk. Rows appended after publishing are scored in the calling process until
+    they exceed republish_fraction of the published rows; tombstones are copied
+    into the shared mask before the next search. Stores smaller than min_rows are
+    searched in-process, where the dispatch overhead would dominate.
+    """
+
+    def __init__(self, n_workers: int = None, min_rows: int = 50000,
+                 republish_fraction: float = 0.1):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.republish_fraction = republish_fraction
+        self._executor = ProcessPoolExecutor(max_workers=self.n_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._layout = None
+        self._deleted = None  # parent's view of the shared tombstone mask
+        self._store = None
+        self._generation = None
+        self._deleted_count = 0
+
+    def _share(self, array: np.ndarray) -> Tuple[str, np.ndarray]:
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        self._blocks.append(block)
+        return block.name, shared
+
+    def _free(self):
+        self._deleted = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        self._layout = None
+
+    def _snapshot_files(self, store: VectorStore) -> Optional[Tuple[str, Optional[str]]]:
+        """(matrix, scales) names for workers to map an opened store's .npy files by,
+        or None when the files were re-saved or too many rows were added since"""
+        snapshot = store.snapshot
+        if snapshot is None or store.size - snapshot["rows"] > self.republish_fraction * snapshot["rows"]:
+            return None
+        directory = snapshot["directory"]
+        try:
+            mtime = os.stat(os.path.join(directory, "embeddings.npy")).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != snapshot["mtime_ns"]:
+            return None
+        # The mtime in the name keeps workers from reusing a map of an older file
+        matrix = f"{os.path.join(directory, 'embeddings.npy')}@{mtime}"
+        scales = f"{os.path.join(directory, 'scales.npy')}@{mtime}" if store.dtype == "int8" else None
+        return matrix, scales
+
+    def publish(self, store: VectorStore):
+        """Share the store's rows and tombstones with the workers.
+
+        The rows are copied into shared memory, doubling the matrix's RAM, unless
+        the store is an opened snapshot the workers can map from disk.
+        """
+        self._free()
+        files = self._snapshot_files(store)
+        if files is not None:
+            size = store.snapshot["rows"]
+            matrix, scales = files
+        else:
+            size = store.size
+            matrix, _ = self._share(store.matrix)
+            scales = self._share(store._scales[:size])[0] if store.dtype == "int8" else None
+        deleted, self._deleted = self._share(store._deleted[:size])
+        self._layout = {
+            "matrix": matrix,
+            "deleted": deleted,
+            "scales": scales,
+            "mapped": files is not None,
+            "dtype": store.dtype,
+            "size": size,
+            "dim": store.dim,
+            "deleted_count": store.deleted_count
+        }
+        self._store = store
+        self._generation = store.generation
+        self._deleted_count = store.deleted_count
+
+    def _sync(self, store: VectorStore):
+        layout = self._layout
+        if (layout is None or store is not self._store or store.generation != self._generation
+                or store.size - layout["size"] > self.republish_fraction * layout["size"]):
+            self.publish(store)
+        elif store.deleted_count != self._deleted_count:
+            self._deleted[:] = store._deleted[:layout["size"]]
+            layout["deleted_count"] = int(self._deleted.sum())
+            self._deleted_count = store.deleted_count
+
+    def _shards(self) -> List[Tuple[int, int]]:
+        size = self._layout["size"]
+        bounds = np.linspace(0, size, min(self.n_workers, max(size, 1)) + 1).astype(int)
+        return [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+    def search_many(self, store: VectorStore, queries: np.ndarray,
+                    top_k: int = 3) -> List[List[Tuple[int, float]]]:
+        """Same results as store.search_many, scored shard-parallel"""
+        if store.size < self.min_rows:
+            return store.search_many(queries, top_k)
+        queries = np.atleast_2d(normalize(queries))
+        self._sync(store)
+        futures = [self._executor.submit(_search_shard, self._layout, start, end, queries, top_k)
+                   for start, end in self._shards()]
+        partials = [future.result() for future in futures]
+
+        tail = np.arange(self._layout["size"], store.size)
+        merged = []
+        for i, query in enumerate(queries):
+            hits = [hit for shard in partials for hit in shard[i]]
+            if len(tail):
+                scores = store.mask_deleted(store.score(query, tail), tail)
+                hits.extend((int(tail[j]), float(scores[j]))
+                            for j in np.flatnonzero(np.isfinite(scores)))
+            merged.append(heapq.nlargest(top_k, hits, key=lambda hit: hit[1]))
+        return merged
+
+    def search(self, store: VectorStore, query: np.ndarray,
+               top_k: int = 3) -> List[Tuple[int, float]]:
+        return self.search_many(store, query, top_k)[0]
+
+    def close(self):
+        self._executor.shutdown()
+        self._free()
+        self._store = None
+
@@ -0,0 +1,55 @@
+import mmap
+import os
+from typing import Iterable, Iterator, List
+import numpy as np
+from vector_store import save_npy
+
+
+def save_texts(directory: str, texts: Iterable[str]):
+    """Write texts as concatenated UTF-8 (texts.bin) plus an offsets array"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "texts.bin")
+    offsets = [0]
+    with open(path + ".tmp", "wb") as f:
+        for text in texts:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    os.replace(path + ".tmp", path)
+    save_npy(os.path.join(directory, "text_offsets.npy"), np.array(offsets, dtype=np.int64))
+
+
+class MappedTexts:
+    """List-like view of texts saved by save_texts, decoded only when accessed.
+
+    Supports append(), so it can stand in for a plain List[str] knowledge base.
+    """
+
+    def __init__(self, directory: str):
+        self._offsets = np.load(os.path.join(directory, "text_offsets.npy"), mmap_mode="r")
+        self._buffer = b""
+        if self._offsets[-1] > 0:
+            with open(os.path.join(directory, "texts.bin"), "rb") as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._count = len(self._offsets) - 1
+        self._appended: List[str] = []
+
+    def __len__(self):
+        return self._count + len(self._appended)
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if i >= self._count:
+            return self._appended[i - self._count]
+        if i < 0:
+            raise IndexError(i)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._buffer[start:end]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, text: str):
+        self._appended.append(text)
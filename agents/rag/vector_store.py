@@ -0,0 +1,341 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+SCORE_BLOCK_ROWS = 65536  # rows up-cast to float32 at a time when scoring quantized data
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise a vector or a matrix of row vectors as float32"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def save_npy(path: str, array: np.ndarray):
+    """np.save via a temp file, so readers that mapped the old file are unaffected"""
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def save_json(path: str, data, **kwargs):
+    """json.dump via a temp file, for the same reason as save_npy"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(path + ".tmp", path)
+
+
+def copy_file(source: str, target: str):
+    """shutil.copyfile via a temp file, for the same reason as save_npy"""
+    shutil.copyfile(source, target + ".tmp")
+    os.replace(target + ".tmp", target)
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first, without a full sort"""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < scores.size:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorStore:
+    """Growable, pre-normalised embedding matrix (one row per document).
+
+    Rows are kept as float32, float16 or int8 with a per-row scale. With a
+    full_precision_path, float32 copies are also appended to that file (emptied when
+    the store is created) so quantized results can be re-scored exactly without
+    keeping them in RAM.
+    """
+
+    def __init__(self, dim: int = None, capacity: int = 1024, dtype: str = "float32",
+                 full_precision_path: str = None):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported storage dtype: {dtype}")
+        self.dim = dim
+        self.size = 0
+        self.dtype = dtype
+        self.full_precision_path = full_precision_path
+        self._capacity = capacity
+        self._matrix = None
+        self._scales = None
+        self._deleted = None  # tombstones, parallel to rows
+        self.deleted_count = 0
+        self.generation = 0  # bumped whenever compact() renumbers rows
+        self._full_precision = None
+        # Set by open(): full_precision_path is the snapshot's file, which must not be
+        # written; the first write copies it to _private_path (or a temp file) first
+        self._full_precision_shared = False
+        self._private_path = None
+        # Set by open(): {"directory", "rows", "mtime_ns"} of the .npy files the first
+        # rows still match on disk; cleared once compact() renumbers rows
+        self.snapshot: Optional[Dict] = None
+        if full_precision_path:
+            # A fresh store starts a fresh file: rows left by an earlier run would be
+            # mapped as this store's first rows
+            open(full_precision_path, "wb").close()
+        if dim is not None:
+            self._reserve(0)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype != "float32"
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the filled rows in storage dtype"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=STORAGE_DTYPES[self.dtype])
+        return self._matrix[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        scales = self._scales[:self.size].nbytes if self._scales is not None else 0
+        return self.matrix.nbytes + scales
+
+    def _reserve(self, rows: int):
+        needed = self.size + rows
+        if self._matrix is not None and needed <= self._matrix.shape[0]:
+            return
+        capacity = max(self._capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=STORAGE_DTYPES[self.dtype])
+        if self._matrix is not None:
+            grown[:self.size] = self._matrix[:self.size]
+        self._matrix = grown
+        if self.dtype == "int8":
+            scales = np.empty(capacity, dtype=np.float32)
+            if self._scales is not None:
+                scales[:self.size] = self._scales[:self.size]
+            self._scales = scales
+        deleted = np.zeros(capacity, dtype=bool)
+        if self._deleted is not None:
+            deleted[:self.size] = self._deleted[:self.size]
+        self._deleted = deleted
+        self._capacity = capacity
+
+    def add(self, embeddings) -> List[int]:
+        """Append one embedding or a matrix of embeddings; returns their row numbers"""
+        vectors = np.atleast_2d(normalize(embeddings))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} != store dimension {self.dim}")
+
+        self._reserve(len(vectors))
+        start, end = self.size, self.size + len(vectors)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._matrix[start:end] = np.round(vectors / scales[:, None])
+            self._scales[start:end] = scales
+        else:
+            self._matrix[start:end] = vectors
+
+        if self.full_precision_path:
+            self._own_full_precision()
+            with open(self.full_precision_path, "ab") as f:
+                f.write(vectors.tobytes())
+            self._full_precision = None
+        self.size = end
+        return list(range(start, end))
+
+    # ================= TOMBSTONES =================
+    def delete(self, row: int):
+        """Tombstone a row; it is skipped by search until compact() drops it"""
+        if not self._deleted[row]:
+            self._deleted[row] = True
+            self.deleted_count += 1
+
+    def mask_deleted(self, scores: np.ndarray, rows=None) -> np.ndarray:
+        """Set the scores of tombstoned rows to -inf (in place)"""
+        if self.deleted_count:
+            deleted = self._deleted[:self.size]
+            scores[deleted if rows is None else deleted[rows]] = -np.inf
+        return scores
+
+    def compact(self) -> np.ndarray:
+        """Drop tombstoned rows; returns the old row number of every kept row"""
+        if self._deleted is None or self.size == 0:
+            return np.arange(self.size)
+        keep = np.flatnonzero(~self._deleted[:self.size])
+        if len(keep) == self.size:
+            return keep
+        self._matrix = self.matrix[keep]
+        if self.dtype == "int8":
+            self._scales = self._scales[:self.size][keep]
+        if self.full_precision_path:
+            self._own_full_precision()
+            kept = np.ascontiguousarray(self._full_precision_rows()[keep])
+            self._full_precision = None
+            with open(self.full_precision_path + ".tmp", "wb") as f:
+                f.write(kept.tobytes())
+            os.replace(self.full_precision_path + ".tmp", self.full_precision_path)
+        self.size = len(keep)
+        self._capacity = max(self.size, 1)
+        self._deleted = np.zeros(self._capacity, dtype=bool)
+        self.deleted_count = 0
+        self.generation += 1
+        self.snapshot = None
+        return keep
+
+    # ================= SCORING =================
+    def vectors(self, rows=None) -> np.ndarray:
+        """Rows (all by default) decoded to float32"""
+        selected = self.matrix if rows is None else self.matrix[rows]
+        decoded = selected.astype(np.float32)
+        if self.dtype == "int8":
+            scales = self._scales[:self.size]
+            decoded *= (scales if rows is None else scales[rows])[:, None]
+        return decoded
+
+    def score(self, query: np.ndarray, rows=None) -> np.ndarray:
+        """Dot products of a normalised query with all (or the given) stored rows"""
+        query = np.asarray(query, dtype=np.float32)
+        if not self.quantized:
+            return (self.matrix if rows is None else self.matrix[rows]) @ query
+
+        count = self.size if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, count)
+            block = slice(start, end) if rows is None else rows[start:end]
+            scores[start:end] = self.matrix[block].astype(np.float32) @ query
+        if self.dtype == "int8":
+            scales = self._scales[:self.size]
+            scores *= scales if rows is None else scales[rows]
+        return scores
+
+    def score_many(self, queries: np.ndarray) -> np.ndarray:
+        """(queries x rows) dot products for a matrix of normalised queries"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if not self.quantized:
+            return queries @ self.matrix.T
+        scores = np.empty((len(queries), self.size), dtype=np.float32)
+        for start in range(0, self.size, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, self.size)
+            scores[:, start:end] = queries @ self.matrix[start:end].astype(np.float32).T
+        if self.dtype == "int8":
+            scores *= self._scales[:self.size]
+        return scores
+
+    def search_many(self, queries: np.ndarray, top_k: int = 3,
+                    max_scores: int = 1 << 25) -> List[List[Tuple[int, float]]]:
+        """search() for many queries with one matrix-matrix product per query block.
+
+        Queries are processed in blocks so that at most max_scores scores are held
+        at once.
+        """
+        queries = np.atleast_2d(normalize(queries))
+        if self.size == 0:
+            return [[] for _ in queries]
+        k = min(top_k, self.size)
+        step = max(1, max_scores // self.size)
+        results = []
+        for start in range(0, len(queries), step):
+            scores = self.score_many(queries[start:start + step])
+            if self.deleted_count:
+                scores[:, self._deleted[:self.size]] = -np.inf
+            if k < self.size:
+                candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.tile(np.arange(self.size), (len(scores), 1))
+            for row_scores, rows in zip(scores, candidates):
+                rows = rows[np.argsort(-row_scores[rows], kind="stable")]
+                results.append([(int(r), float(row_scores[r]))
+                                for r in rows if np.isfinite(row_scores[r])])
+        return results
+
+    def search(self, query: np.ndarray, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Cosine top-k as (row, score) pairs via one matrix-vector product"""
+        if self.size == 0:
+            return []
+        scores = self.mask_deleted(self.score(normalize(query)))
+        rows = top_k_indices(scores, top_k)
+        return [(int(r), float(scores[r])) for r in rows if np.isfinite(scores[r])]
+
+    def _own_full_precision(self):
+        """Copy a snapshot's float32 file to a private path before modifying it"""
+        if not self._full_precision_shared:
+            return
+        target = self._private_path
+        if target is None:
+            fd, target = tempfile.mkstemp(suffix=".f32")
+            os.close(fd)
+        copy_file(self.full_precision_path, target)
+        self.full_precision_path = target
+        self._full_precision = None
+        self._full_precision_shared = False
+
+    def _full_precision_rows(self) -> np.ndarray:
+        if self._full_precision is None or len(self._full_precision) != self.size:
+            expected = self.size * self.dim * np.dtype(np.float32).itemsize
+            actual = os.path.getsize(self.full_precision_path)
+            if actual != expected:
+                raise ValueError(f"{self.full_precision_path} holds {actual} bytes, "
+                                 f"expected {expected} for {self.size} rows of {self.dim}")
+            self._full_precision = np.memmap(self.full_precision_path, dtype=np.float32,
+                                             mode="r", shape=(self.size, self.dim))
+        return self._full_precision
+
+    def rerank(self, query: np.ndarray, hits: List[Tuple[int, float]],
+               top_k: int) -> List[Tuple[int, float]]:
+        """Re-score a quantized shortlist against the float32 copies on disk"""
+        if not hits or not self.full_precision_path:
+            return hits[:top_k]
+        rows = np.array([row for row, _ in hits])
+        scores = self._full_precision_rows()[rows] @ normalize(query)
+        return [(int(rows[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    # ================= PERSISTENCE =================
+    def save(self, directory: str):
+        """Write the filled rows as .npy files that open() can memory-map"""
+        save_npy(os.path.join(directory, "embeddings.npy"), self.matrix)
+        if self.dtype == "int8":
+            save_npy(os.path.join(directory, "scales.npy"), self._scales[:self.size])
+        if self.full_precision_path:
+            target = os.path.join(directory, "full_precision.f32")
+            if os.path.abspath(target) != os.path.abspath(self.full_precision_path):
+                copy_file(self.full_precision_path, target)
+
+    @classmethod
+    def open(cls, directory: str, full_precision_path: str = None) -> "VectorStore":
+        """Memory-map a saved matrix read-only; pages are shared between processes.
+
+        The first add() after opening copies the rows into private memory. The
+        snapshot's full_precision.f32 is never written: the first add() or compact()
+        copies it to full_precision_path (default: a temp file) and works on that.
+        """
+        path = os.path.join(directory, "embeddings.npy")
+        matrix = np.load(path, mmap_mode="r")
+        dtype = next(name for name, t in STORAGE_DTYPES.items() if matrix.dtype == t)
+        full_precision = os.path.join(directory, "full_precision.f32")
+        store = cls(dtype=dtype)  # not passed in: the constructor would truncate it
+        if os.path.exists(full_precision):
+            store.full_precision_path = full_precision
+            store._full_precision_shared = True
+        store._private_path = full_precision_path
+        if len(matrix) == 0:  # empty index: dimension is set by the first add()
+            return store
+        store._matrix = matrix
+        store.size, store.dim = matrix.shape
+        store._capacity = max(store.size, 1)
+        store.snapshot = {"directory": directory, "rows": store.size,
+                          "mtime_ns": os.stat(path).st_mtime_ns}
+        if dtype == "int8":
+            store._scales = np.load(os.path.join(directory, "scales.npy"), mmap_mode="r")
+        store._deleted = np.zeros(store._capacity, dtype=bool)
+        return store
@@ -1,7 +1,12 @@
 import os
 from dotenv import load_dotenv
 from google import genai
-from typing import List, Dict
+from typing import List, Dict, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from context_packing import pack_context
+from keyword_index import InvertedIndex, whitespace_tokenize
+from text_store import save_texts, MappedTexts
+from pattern_matcher import PatternMatcher
 
 load_dotenv()
 
@@ -37,15 +42,24 @@ class GuardrailAgent:
         self.blocked_topics = ['violence', 'harmful', 'illegal', 'hate']
         self.max_length = 4000
     
+    @property
+    def blocked_topics(self) -> tuple:
+        return self._matcher.patterns
+    
+    @blocked_topics.setter
+    def blocked_topics(self, topics: Iterable[str]):
+        # Build first, then swap: in-flight validations keep the old automaton
+        self._matcher = PatternMatcher(topics)
+    
     def validate_input(self, user_input: str):
         if len(user_input) > self.max_length:
             return False, "Input too long (max 4000 chars)"
         if not user_input.strip():
             return False, "Empty input not allowed"
         
-        for topic in self.blocked_topics:
-            if topic in user_input.lower():
-                return False, f"Blocked topic: {topic}"
+        topic = self._matcher.search(user_input)
+        if topic is not None:
+            return False, f"Blocked topic: {topic}"
         
         return True, None
     
@@ -66,32 +80,45 @@ class GuardrailAgent:
 class SimpleRAGAgent:
     """✅ ALREADY WORKING PERFECTLY"""
     
-    def __init__(self):
+    def __init__(self, context_token_budget: int = 750):
         self.knowledge_base = []
+        self.index = InvertedIndex(tokenizer=whitespace_tokenize)
+        self.context_token_budget = context_token_budget
     
     def add_knowledge(self, text: str):
+        self.index.add(len(self.knowledge_base), text)
         self.knowledge_base.append(text)
         print(f"📚 Added knowledge ({len(text)} chars)")
     
+    def save_snapshot(self, directory: str):
+        save_texts(directory, self.knowledge_base)
+        self.index.save(directory)
+        print(f"💾 Saved knowledge snapshot to {directory}")
+    
+    def load_snapshot(self, directory: str):
+        self.index = InvertedIndex.open(directory)
+        self.knowledge_base = MappedTexts(directory)
+        print(f"📚 Loaded knowledge snapshot ({len(self.knowledge_base)} docs)")
+    
     def retrieve_context(self, query: str, top_k: int = 3) -> str:
+        return self._retrieve(query, top_k)[0]
+    
+    def _retrieve(self, query: str, top_k: int = 3) -> Tuple[str, List[str]]:
         if not self.knowledge_base:
-            return "No knowledge available."
-        
-        query_words = set(query.lower().split())
-        scored = []
+            return "No knowledge available.", []
         
-        for i, doc in enumerate(self.knowledge_base):
-            doc_words = set(doc.lower().split())
-            score = len(query_words & doc_words)
-            scored.append((score, doc[:1000]))
+        top = [(score, self.knowledge_base[doc_id])
+               for doc_id, score in self.index.overlap_search(query, top_k)]
+        # Token-budgeted packing: drops repeated sentences, cuts at sentence boundaries
+        packed = pack_context([doc for _, doc in top], [score for score, _ in top],
+                              token_budget=self.context_token_budget)
+        relevant = [text for _, text in packed]
         
-        scored.sort(reverse=True, key=lambda x: x[0])
-        relevant = [doc for score, doc in scored[:top_k] if score > 0]
-        
-        return "\n\n---\n\n".join(relevant) if relevant else "No relevant info found."
+        context = "\n\n---\n\n".join(relevant) if relevant else "No relevant info found."
+        return context, relevant
     
-    def answer_question(self, question: str) -> str:
-        context = self.retrieve_context(question)
+    def _answer(self, question: str) -> Tuple[str, List[str]]:
+        context, sources = self._retrieve(question)
         
         prompt = f"""Answer using ONLY this context. If answer not in context, say "I don't know".
 
@@ -102,14 +129,31 @@ QUESTION: {question}
 
 ANSWER:"""
         
+        response = client.models.generate_content(
+            model=MODEL_NAME,
+            contents=[prompt]
+        )
+        return response.text.strip(), sources
+    
+    def answer_question(self, question: str) -> str:
         try:
-            response = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=[prompt]
-            )
-            return response.text.strip()
+            return self._answer(question)[0]
         except Exception as e:
             return f"❌ Error: {str(e)}"
+    
+    def answer_questions(self, questions: List[str], max_concurrency: int = 8) -> List[Dict]:
+        """Batch answers (input order), generation calls run concurrently.
+        Each is {"question", "answer", "sources", "error"}, like the RAG agents'."""
+        def answer(question: str) -> Dict:
+            try:
+                text, sources = self._answer(question)
+                return {"question": question, "answer": text,
+                        "sources": [doc[:100] for doc in sources], "error": None}
+            except Exception as e:
+                return {"question": question, "answer": None, "sources": [], "error": str(e)}
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            return list(pool.map(answer, questions))
 
 # 🧪 FIXED TEST SUITE
 def test_all_agents():
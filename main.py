@@ -52,8 +52,12 @@ def main():
     
     elif choice == "4":
         agent = SimpleRAGAgent()
-        agent.add_knowledge("AI is artificial intelligence.")
-        agent.add_knowledge("Python is a programming language.")
+        snapshot = os.getenv('RAG_SNAPSHOT')
+        if snapshot and os.path.isdir(snapshot):
+            agent.load_snapshot(snapshot)
+        else:
+            agent.add_knowledge("AI is artificial intelligence.")
+            agent.add_knowledge("Python is a programming language.")
         
         print("\n--- RAG Agent ---")
         while True:
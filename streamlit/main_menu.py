@@ -111,11 +111,17 @@ def run_basic_rag():
     
     agent = SimpleRAGAgent()
     
-    # Add sample knowledge
-    print("📥 Loading sample knowledge base...")
-    agent.add_knowledge("Python is a high-level programming language created by Guido van Rossum in 1991.")
-    agent.add_knowledge("AI agents are autonomous programs that can perceive and act on their environment.")
-    agent.add_knowledge("Machine learning is a subset of AI that learns from data without explicit programming.")
+    snapshot = os.getenv('RAG_SNAPSHOT')
+    if snapshot and os.path.isdir(snapshot):
+        # Snapshot is memory-mapped, so startup doesn't grow with corpus size
+        print(f"📥 Loading knowledge snapshot from {snapshot}...")
+        agent.load_snapshot(snapshot)
+    else:
+        # Add sample knowledge
+        print("📥 Loading sample knowledge base...")
+        agent.add_knowledge("Python is a high-level programming language created by Guido van Rossum in 1991.")
+        agent.add_knowledge("AI agents are autonomous programs that can perceive and act on their environment.")
+        agent.add_knowledge("Machine learning is a subset of AI that learns from data without explicit programming.")
     print("✓ Knowledge base loaded!\n")
     
     print("Agent: Ask me questions about Python, AI, or Machine Learning!")
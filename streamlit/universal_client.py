@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 from google import genai
 from typing import Optional, List
+from embedding_cache import get_default_cache
 
 load_dotenv()
 
@@ -32,7 +33,12 @@ def generate_content(prompt: str, model: str = "gemini-2.5-flash") -> str:
         return f"❌ Error: {str(e)}"
 
 def generate_embedding(text: str, model: str = "text-embedding-004") -> list:
-    """✅ Embeddings already working (your test passed!)"""
+    """✅ Embeddings already working (your test passed!) - cached per (model, text)"""
+    cache = get_default_cache()
+    cached = cache.get(model, text)
+    if cached is not None:
+        return cached.tolist()
+    
     client = get_gemini_client(model)
     
     try:
@@ -40,7 +46,9 @@ def generate_embedding(text: str, model: str = "text-embedding-004") -> list:
             model=model,
             contents=[text]
         )
-        return response.embeddings[0].values
+        values = response.embeddings[0].values
+        cache.put(model, text, values)
+        return values
     except Exception as e:
         print(f"❌ Embedding error: {e}")
         return []